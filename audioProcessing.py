@@ -0,0 +1,171 @@
+import collections as col
+import logging
+import time
+import wave
+import numpy as np
+import midiProcessing as mp
+import notes
+
+logger = logging.getLogger(__name__)
+
+# Settings of the audio front end
+# hopSize:        Samples between the starts of two analysis frames
+# blockFrames:    Frames analysed together in one batch; Memory use depends on this and the frame size, not on the length of the recording
+# minNote/maxNote: Range of MIDI notes listened for
+# minLevel:       Quietest spectral peak counted as a note, relative to a full scale sine
+# relLevel:       Peaks quieter than this fraction of the loudest peak in the frame are ignored
+# harmonicFalloff: Expected level of every harmonic of a note relative to the one before it; A peak on an overtone of a sounding note that is no louder than expected is taken as that overtone
+# maxPolyphony:   Most notes kept per frame
+# riseThreshold:  How much a note has to grow (natural log of its level) over half a frame to count as an attack
+hopSize       = 512
+blockFrames   = 256
+minNote       = 36
+maxNote       = 96
+minLevel      = 0.01
+relLevel      = 0.1
+harmonicFalloff = 0.6
+maxPolyphony  = 6
+riseThreshold = 0.7
+
+# Overtones checked by harmonicFalloff, as (semitones above the note, harmonic number); The 2nd, 3rd and 4th harmonics
+# The 2nd harmonic is expected at 0.6 of the note, the 3rd at 0.36 and the 4th at 0.22 by default; Chord notes an octave or a fifth up are played louder than that, so they are kept
+harmonics = ((12, 2), (19, 3), (24, 4))
+
+class AudioError(mp.MIDIError):
+    pass
+
+# Analysis frame size for a sample rate; The smallest power of two covering a tenth of a second, which is enough to tell the lowest guitar notes apart
+def frameSizeFor(sampleRate):
+    return 1 << int(np.ceil(np.log2(sampleRate / 10)))
+
+# Converts raw little endian PCM frames to mono float32 samples in [-1, 1]
+def decodeSamples(raw, width, channels):
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype = np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype = "<i2").astype(np.float32) / (1 << 15)
+    elif width == 3:
+        bytes3 = np.frombuffer(raw, dtype = np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = (((bytes3[:, 0] | (bytes3[:, 1] << 8) | (bytes3[:, 2] << 16)) << 8) >> 8).astype(np.float32) / (1 << 23)
+    else:
+        samples = np.frombuffer(raw, dtype = "<i4").astype(np.float32) / (1 << 31)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis = 1)
+    return samples
+
+# This function reads a WAV file a block at a time, so only one block of samples is ever held in memory
+# Consecutive blocks overlap by a frame, so every analysis frame is whole; The end of the file is padded with a frame of silence
+# Yields (index of the first frame in the block, mono samples covering the frames of the block)
+def readBlocks(wav, frameSize, hop = hopSize, frames = blockFrames):
+    width, channels = wav.getsampwidth(), wav.getnchannels()
+    carry = np.zeros(0, dtype = np.float32)
+    first = 0
+    done = False
+    while not done:
+        raw = wav.readframes(frames * hop)
+        done = not raw
+        buffer = np.concatenate((carry, decodeSamples(raw, width, channels) if raw else np.zeros(frameSize, dtype = np.float32)))
+        count = (len(buffer) - frameSize) // hop + 1 if len(buffer) >= frameSize else 0
+        if count > 0:
+            yield first, buffer[:(count - 1) * hop + frameSize]
+            carry = buffer[count * hop:]
+            first += count
+
+# This function finds the notes sounding in every frame of a block, with one batched FFT over all of its frames
+# Spectral peaks are placed between bins by parabolic interpolation, and mapped to notes with notes.frequenciesToMIDI
+# Returns a (frames x 128) float32 matrix of the level of every note in every frame (0 for notes not sounding)
+def noteLevels(samples, frameSize, sampleRate, window, hop = hopSize):
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frameSize)[::hop] * window
+    # Only bins up to the highest note listened for are needed; A sine of amplitude A peaks at A after scaling
+    maxBin = int(notes.midiFrequencies[min(maxNote + 1, 127)] * frameSize / sampleRate) + 2
+    spectrum = np.abs(np.fft.rfft(frames, axis = 1)[:, :maxBin]).astype(np.float32) / (window.sum() / 2)
+
+    middle = spectrum[:, 1:-1]
+    peaks = (middle > spectrum[:, :-2]) & (middle >= spectrum[:, 2:]) & (middle >= minLevel) & (middle >= relLevel * spectrum.max(axis = 1, keepdims = True))
+    frameIndex, binIndex = np.nonzero(peaks)
+    binIndex += 1
+    below, level, above = (np.log(spectrum[frameIndex, binIndex + offset]) for offset in (-1, 0, 1))
+    curve = below - 2 * level + above
+    shift = np.where(curve < 0, 0.5 * (below - above) / np.where(curve < 0, curve, -1), 0)
+    midiNotes = notes.frequenciesToMIDI((binIndex + shift) * sampleRate / frameSize)
+
+    keep = (midiNotes >= minNote) & (midiNotes <= maxNote)
+    levels = np.zeros((len(frames), 128), dtype = np.float32)
+    np.maximum.at(levels, (frameIndex[keep], midiNotes[keep]), spectrum[frameIndex[keep], binIndex[keep]])
+
+    # Overtones of a sounding note are dropped, unless they are louder than the note's own harmonic would be
+    # Where the harmonics of several notes land on the same peak, their expected levels add up
+    expected = np.zeros_like(levels)
+    for semitones, harmonic in harmonics:
+        expected[:, semitones:] += levels[:, :-semitones] * harmonicFalloff ** (harmonic - 1)
+    sounding = np.where(levels > expected, levels, 0)
+    if maxPolyphony < 128:
+        quietest = np.partition(sounding, -maxPolyphony, axis = 1)[:, -maxPolyphony:-maxPolyphony + 1]
+        sounding[sounding < quietest] = 0
+    return sounding
+
+# This function reads a WAV file and detects every note attack in it, a block at a time
+# A note's level is compared to its level half a frame earlier, as frames overlap and an attack takes that long to fully come in
+# An attack is where that rise peaks, and is at least riseThreshold (log); Notes that keep ringing are not attacked again
+# Times are converted to ticks at the given tpb/tempo, and snapped to the nearest point of the eighth grid used by midiProcessing.quantizeEvents
+# (Unlike snapTick, which only moves notes back; Detected attacks land a little either side of the beat)
+# Yields (absolute tick, notes to play on that tick) in increasing tick order, the same as quantizeEvents
+# Raises AudioError if the file can not be read as PCM audio
+def audioEvents(iFileName, tpb = 480, tempo = 500000):
+    try:
+        wav = wave.open(iFileName, "rb")
+    except FileNotFoundError:
+        logger.error (f"Unable to find specified file: {iFileName}")
+        raise AudioError (f"Unable to find specified file: {iFileName}")
+    except (wave.Error, EOFError) as e:
+        logger.error (f"Unable to read the specified WAV file: {iFileName}: {e}")
+        raise AudioError (f"Unable to read the specified WAV file: {iFileName}: {e}") from e
+
+    with wav:
+        sampleRate = wav.getframerate()
+        frameSize = frameSizeFor(sampleRate)
+        window = np.hanning(frameSize).astype(np.float32)
+        ticksPerSecond = tpb * 1000000 / tempo
+        seconds = wav.getnframes() / sampleRate
+        logger.info (f"Reading {seconds:.1f}s of audio ({wav.getnchannels()} channels, {sampleRate} Hz, {8 * wav.getsampwidth()} bit) in frames of {frameSize}")
+        mp.setGrid(tpb)
+        start = time.perf_counter()
+
+        # The last frames of the previous block, so attacks on block boundaries are found the same as anywhere else
+        lag = max(frameSize // hopSize // 2, 1)
+        tail = np.full((lag + 2, 128), np.log(minLevel), dtype = np.float32)
+        currTick = -1
+        currNotes = []
+        attacks = 0
+        for first, samples in readBlocks(wav, frameSize):
+            logLevels = np.concatenate((tail, np.log(np.maximum(noteLevels(samples, frameSize, sampleRate, window), minLevel))))
+            tail = logLevels[-(lag + 2):]
+            rise = logLevels[lag:] - logLevels[:-lag]
+            # rise[i] is the change over lag frames into frame first - 2 + i; Attacks are the frames where the rise peaks
+            attack = (rise[1:-1] >= riseThreshold) & (rise[1:-1] > rise[:-2]) & (rise[1:-1] >= rise[2:])
+            for row, note in zip(*np.nonzero(attack)):
+                frame = first - 1 + int(row)
+                if frame < 0:
+                    continue
+                attacks += 1
+                # The attack is heard once it fills the first part of the frame
+                tick = int(round((frame * hopSize + frameSize / 4) / sampleRate * ticksPerSecond / mp._8th)) * mp._8th
+                if tick != currTick and currNotes:
+                    yield currTick, currNotes
+                    currNotes = []
+                currTick = tick
+                if int(note) not in currNotes:
+                    currNotes.append(int(note))
+        if currNotes:
+            yield currTick, currNotes
+        elapsed = time.perf_counter() - start
+        logger.info (f"Found {attacks} note attacks in {elapsed:.2f}s ({seconds / elapsed if elapsed else 0:.0f}x real time)")
+
+# This function transcribes a WAV file to the noteTime table, the same as midiProcessing.quantizeMIDI does for a MIDI file
+# The recording has no tempo of its own, so ticks are laid out at the given tpb/tempo (120 bpm by default)
+# Returns (noteTime, ticks per beat, tempo)
+def quantizeAudio(iFileName, tpb = 480, tempo = 500000):
+    logger.info ("Quantize input WAV file")
+    noteTime = col.OrderedDict(mp.requireNotes(audioEvents(iFileName, tpb, tempo), iFileName))
+    logger.info (f"WAV file successfully quantized: {len(noteTime)} chords")
+    return noteTime, tpb, tempo
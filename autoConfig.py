@@ -0,0 +1,90 @@
+import concurrent.futures as cf
+import logging
+import numpy as np
+import midiProcessing as mp
+import notes
+
+logger = logging.getLogger(__name__)
+
+# Weights used to score a tuning/capo configuration; Lower scores are better
+# UNPLAYABLE_WEIGHT:  Cost per note left out of the tab (unplayable notes, and every note of a chord with no playable fingering)
+# SPAN_WEIGHT:        Cost per fret of average stretch within a chord
+# SHIFT_WEIGHT:       Cost per fret of average hand movement between chords
+UNPLAYABLE_WEIGHT = 10.0
+SPAN_WEIGHT       = 1.0
+SHIFT_WEIGHT      = 1.0
+
+# Chords and settings shared by every configuration; Set up once per worker process by initWorker
+workerState = {}
+
+# This function reduces a song to its distinct chords, so each one only has to be solved once per configuration
+# Chords are keyed by their notes in play order (repeats dropped), the same as the voicing cache
+# Returns (list of distinct chords, int32 array with the index of the distinct chord for every chord of the song)
+def distinctChords(events):
+    index = {}
+    sequence = []
+    for _, notesToPlay in events:
+        key = tuple(dict.fromkeys(notesToPlay))
+        sequence.append(index.setdefault(key, len(index)))
+    return list(index), np.array(sequence, dtype = np.int32)
+
+def initWorker(chords, sequence, maxFret, maxFWidth):
+    workerState["chords"] = chords
+    workerState["sequence"] = sequence
+    workerState["maxFret"] = maxFret
+    workerState["maxFWidth"] = maxFWidth
+
+# Scores a single configuration inside a worker
+# Every distinct chord is solved once, then the per-chord results are spread over the song with array indexing
+def scoreConfiguration(configuration):
+    tuning, capo = configuration
+    chords, sequence = workerState["chords"], workerState["sequence"]
+    noteTable = notes.FretTable(iTuning = tuning, capo = capo, maxFret = workerState["maxFret"])
+
+    # Per distinct chord: notes left out, stretch, and hand position on the neck (NaN for open strings only/unplayable)
+    missing = np.zeros(len(chords))
+    span = np.zeros(len(chords))
+    position = np.full(len(chords), np.nan)
+    for i, chord in enumerate(chords):
+        voicing = mp.solveChord(chord, noteTable, workerState["maxFWidth"])
+        if voicing is None:
+            missing[i] = len(chord)
+            continue
+        fretted = [fret for fret in voicing if fret > 0]
+        if fretted:
+            span[i] = max(fretted) - min(fretted)
+            position[i] = sum(fretted) / len(fretted) + capo
+
+    songMissing = missing[sequence]
+    songSpan = span[sequence]
+    songPosition = position[sequence]
+    # Hand movement only counts between chords that are actually fretted
+    fretted = songPosition[~np.isnan(songPosition)]
+    shifts = np.abs(np.diff(fretted)) if len(fretted) > 1 else np.zeros(1)
+    played = songMissing == 0
+
+    result = {
+        "tuning": tuning,
+        "capo": capo,
+        "missingNotes": int(songMissing.sum()),
+        "averageSpan": float(songSpan[played].mean()) if played.any() else 0.0,
+        "averageShift": float(shifts.mean()),
+    }
+    result["score"] = UNPLAYABLE_WEIGHT * result["missingNotes"] / len(sequence) + SPAN_WEIGHT * result["averageSpan"] + SHIFT_WEIGHT * result["averageShift"]
+    return result
+
+# This function scores every tuning in notes.Tunings with every capo position from 0 to maxCapo, from one quantized song
+# The song is reduced to its distinct chords once, and the configurations are scored over a pool of worker processes
+# Returns the configurations ranked from best to worst
+def rankConfigurations(noteTime, maxCapo = 7, maxFret = 15, maxFWidth = 5, workers = None, tunings = None):
+    chords, sequence = distinctChords(noteTime.items())
+    configurations = [(tuning, capo) for tuning in (tunings or notes.Tunings) for capo in range(maxCapo + 1)]
+    logger.info (f"Scoring {len(configurations)} configurations over {len(chords)} distinct chords ({len(sequence)} chords in the song)")
+    with cf.ProcessPoolExecutor(max_workers = workers, initializer = initWorker, initargs = (chords, sequence, maxFret, maxFWidth)) as pool:
+        results = list(pool.map(scoreConfiguration, configurations))
+    return sorted(results, key = lambda result: (result["score"], result["capo"]))
+
+def printRanking(ranking, top = 10):
+    print ("| Rank | Tuning     | Capo |  Score | Missing notes | Avg. span | Avg. shift |")
+    for rank, result in enumerate(ranking[:top], 1):
+        print (f"| {rank:4} | {result['tuning']:10} | {result['capo']:4} | {result['score']:6.2f} | {result['missingNotes']:13} | {result['averageSpan']:9.2f} | {result['averageShift']:10.2f} |")
@@ -0,0 +1,108 @@
+import collections as col
+import concurrent.futures as cf
+import glob
+import logging
+import os
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Settings and warm state for the current worker process; Set up once by initWorker and reused for every file the worker handles
+workerSettings = {}
+workerNoteTable = None
+workerCache = None
+
+# Finds the MIDI files to transcribe; The input can either be a folder (every .mid file inside it) or a glob pattern
+def findInputs(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.mid")
+    return sorted(f for f in glob.glob(pattern) if f.lower().endswith(".mid"))
+
+# Picks the ./output folder name of every input file: The file name without the extension, with as many parent folders in front as it takes to tell files of the same name apart
+# e.g. songs/a/intro.mid and songs/b/intro.mid go to ./output/a_intro and ./output/b_intro, while songs/a/outro.mid stays ./output/outro
+# Returns {file name: output name}, or None if some files can still not be told apart
+def outputNames(files):
+    parts = {f: os.path.normpath(os.path.splitext(f)[0]).split(os.sep) for f in files}
+    depth = dict.fromkeys(files, 1)
+    while True:
+        names = {f: "_".join(parts[f][-depth[f]:]) for f in files}
+        counts = col.Counter(names.values())
+        clashes = [f for f in files if counts[names[f]] > 1]
+        if not clashes:
+            return names
+        if all(depth[f] == len(parts[f]) for f in clashes):
+            return None
+        for f in clashes:
+            depth[f] = min(depth[f] + 1, len(parts[f]))
+
+# Runs once in each worker process; Imports the pipeline and builds the note table/voicing cache a single time
+# settings holds any other keyword arguments for main.main (e.g. the quantization grid)
+def initWorker(tuning, maxFWidth, capo, maxFret, candidates, cachePath, settings):
+    global workerSettings, workerNoteTable, workerCache
+    import notes
+    import voicingCache as vc
+    workerSettings = {"tuning": tuning, "maxFWidth": maxFWidth, "capo": capo, "maxFret": maxFret, "candidates": candidates, **settings}
+    workerNoteTable = notes.FretTable(iTuning = tuning, capo = capo, maxFret = maxFret)
+    workerCache = vc.VoicingCache(tuning, capo, maxFret, maxFWidth, path = cachePath)
+
+# Transcribes a single file inside a worker; Never raises, so one bad file can not take down the batch
+# Returns (file name, seconds taken, error message or None)
+def transcribeFile(iFileName, outName):
+    import main
+    start = time.perf_counter()
+    try:
+        main.main(iFileName, noteTable = workerNoteTable, cache = workerCache, outName = outName, **workerSettings)
+        error = None
+    except Exception as e:
+        logger.error (f"Failed to transcribe {iFileName}: {e}")
+        logger.debug (traceback.format_exc())
+        error = f"{type(e).__name__}: {e}"
+    return iFileName, time.perf_counter() - start, error
+
+# Transcribes every MIDI file matching the input over a pool of worker processes
+# Every file gets the same output as a single run, in a folder named by outputNames (./output/<name>/tab.txt, and quantized.mid with --midi); A summary is printed at the end
+# Returns the list of (file name, seconds taken, error message or None), in input order
+def runBatch(pattern, workers = None, tuning = "standard", maxFWidth = 5, capo = 0, maxFret = 15, candidates = 0, cachePath = None, **settings):
+    files = findInputs(pattern)
+    if not files:
+        print (f"Error - No MIDI files found for: {pattern}")
+        logger.error (f"No MIDI files found for: {pattern}")
+        return []
+    names = outputNames(files)
+    if names is None:
+        print (f"Error - Some input files can not be told apart by their names and folders: {pattern}")
+        logger.error (f"Output names clash for: {pattern}")
+        return []
+    logger.info (f"Batch transcribing {len(files)} files from: {pattern}")
+
+    start = time.perf_counter()
+    results = {}
+    with cf.ProcessPoolExecutor(max_workers = workers, initializer = initWorker,
+                                initargs = (tuning, maxFWidth, capo, maxFret, candidates, cachePath, settings)) as pool:
+        futures = {pool.submit(transcribeFile, f, names[f]): f for f in files}
+        for future in cf.as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed or out of memory)
+                results[futures[future]] = (futures[future], 0.0, f"{type(e).__name__}: {e}")
+    elapsed = time.perf_counter() - start
+
+    results = [results[f] for f in files]
+    printSummary(results, elapsed)
+    return results
+
+def printSummary(results, elapsed):
+    failures = [r for r in results if r[2] is not None]
+    print ("")
+    print ("| File                                     | Seconds | Result")
+    for iFileName, seconds, error in results:
+        print (f"| {iFileName[-40:]:40} | {seconds:7.3f} | {error if error else 'OK'}")
+    print ("")
+    print (f"Transcribed {len(results) - len(failures)}/{len(results)} files in {elapsed:.2f}s ({len(results)/elapsed if elapsed else 0:.2f} files/s)")
+    if failures:
+        print (f"{len(failures)} failed:")
+        for iFileName, _, error in failures:
+            print (f"        {iFileName}: {error}")
+    logger.info (f"Batch finished: {len(results) - len(failures)}/{len(results)} files in {elapsed:.2f}s, {len(failures)} failed")
@@ -0,0 +1,5 @@
+# Benchmarks for the transcription pipeline
+# synthMIDI:  Seeded synthetic MIDI files to time the pipeline on
+# timing:     Timed runs of every pipeline stage over a corpus of MIDI files
+# accuracy:   Parses hand-made ASCII tabulature (e.g. radical.txt) and scores generated tabs against it
+# Run everything with: python -m benchmarks (see __main__.py)
@@ -0,0 +1,97 @@
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import midiProcessing as mp
+import notes
+import tabProcessing as tp
+import audioProcessing as ap
+from benchmarks import accuracy, synthAudio, synthMIDI, timing
+
+# Runs the benchmarks from the repository root: python -m benchmarks
+# -o<file>:      Where the JSON results are written; Default value of ./output/benchmarks/results.json
+# -n<repeats>:   How many times every stage is timed; Default value of 3
+# -s<seed>:      Seed for the synthetic corpus; Default value of 0
+# -q:            Quick run on the short/medium songs only
+oFileName = os.path.join(".", "output", "benchmarks", "results.json")
+repeats = 3
+seed = 0
+quick = False
+
+def processArgs(argv):
+    global oFileName, repeats, seed, quick
+    for arg in argv:
+        match arg[0:2].lower():
+            case "-o":
+                oFileName = arg[2:]
+            case "-n":
+                repeats = int(arg[2:])
+            case "-s":
+                seed = int(arg[2:])
+            case "-q":
+                quick = True
+
+# The commit being benchmarked, so results can be compared across commits
+def currentCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Transcribes radical.mid (chord by chord and with the whole-song optimizer) and scores both against the hand-made radical.txt
+def radicalAccuracy(oFolder):
+    results = {}
+    noteTime, tpb, tempo = mp.quantizeMIDI("radical.mid")
+    noteTable = notes.FretTable()
+    with contextlib.redirect_stdout(io.StringIO()):
+        modes = {"chordByChord": mp.notesToTabs(noteTime, tpb, tempo, noteTable, 5),
+                 "global": mp.notesToTabsGlobal(noteTime, tpb, tempo, noteTable, 5)}
+    for mode, tabs in modes.items():
+        oTabFile = os.path.join(oFolder, f"radical_{mode}.txt")
+        tp.tabPrettyPrint(tabs, oTabFile)
+        results[mode] = accuracy.scoreFiles(oTabFile, "radical.txt")
+    return results
+
+# Transcribes recordings of open position chords (see synthAudio.py) and checks that every chord note is heard, octaves and fifths included
+def audioAccuracy(oFolder):
+    results = {}
+    chords = synthAudio.Chords
+    for timbre in synthAudio.Timbres:
+        oWavFile = os.path.join(oFolder, f"chords_{timbre}.wav")
+        synthAudio.writeChords(oWavFile, [chordNotes for _, chordNotes in chords], timbre)
+        # One second per chord is 960 ticks at the default 480 ticks per beat and 120 bpm; Attacks may land an eighth either side
+        results[timbre] = accuracy.scoreChords(ap.audioEvents(oWavFile), chords, 960, 60)
+    return results
+
+def run():
+    oFolder = os.path.dirname(oFileName) or "."
+    corpus = synthMIDI.Corpus[:2] if quick else synthMIDI.Corpus
+    files = synthMIDI.writeCorpus(os.path.join(oFolder, "corpus"), seed, corpus)
+    results = {
+        "commit": currentCommit(),
+        "date": datetime.datetime.now().isoformat(timespec = "seconds"),
+        "python": platform.python_version(),
+        "seed": seed,
+        "timing": timing.timeCorpus(files, os.path.join(oFolder, "tabs"), repeats),
+        "accuracy": {"radical": radicalAccuracy(oFolder), "audioChords": audioAccuracy(oFolder)}
+    }
+    with open (oFileName, "w") as oFile:
+        json.dump(results, oFile, indent = 2)
+
+    print ("| Song           | quantizeMIDI | notesToTabs | tabPrettyPrint |   Chords |")
+    for name, result in results["timing"].items():
+        print (f"| {name:14} | {result['quantizeMIDI']['min']:11.4f}s | {result['notesToTabs']['min']:10.4f}s | {result['tabPrettyPrint']['min']:13.4f}s | {result['chords']:8} |")
+    for mode, score in results["accuracy"]["radical"].items():
+        print (f"radical.mid ({mode}): pitch match {score['pitchMatch']:.3f}, fingering {score['fingering']:.3f}, exact chords {score['exactChords']:.3f}")
+    for timbre, chords in results["accuracy"]["audioChords"].items():
+        missing = {name: score["missing"] for name, score in chords.items() if score["missing"]}
+        print (f"Audio chords ({timbre}): {len(chords) - len(missing)}/{len(chords)} with every note heard" + (f"; Missing: {missing}" if missing else ""))
+    print (f"Results written to: {oFileName}")
+
+if __name__ == "__main__":
+    processArgs(sys.argv[1:])
+    run()
@@ -0,0 +1,88 @@
+import difflib
+import re
+import notes
+
+# Lines of tabulature only hold these characters once the string name (e.g. "E||") is taken off the front
+tabLine = re.compile(r"^[-0-9|*hpbrs/\\~x()]+$")
+stringName = re.compile(r"^[A-Ga-g][#b]?\|*")
+
+# This function reads ASCII tabulature (hand-made, like radical.txt, or generated by tabProcessing) into a list of chords
+# A system is 6 lines of tabulature in a row, highest string on top; Everything else (titles, rhythm markings, endings) is skipped
+# Notes on different strings that end on the same character are played together; Bar lines, repeats and techniques (h, p, ...) are ignored
+# Returns a list of chords, each a sorted tuple of (string index, fret) with string index 0 as the lowest string
+def parseTabs(text):
+    chords = []
+    block = []
+    for line in text.splitlines() + [""]:
+        line = stringName.sub("", line.strip())
+        if len(line) > 1 and tabLine.match(line):
+            block.append(line)
+            continue
+        if len(block) == 6:
+            chords.extend(parseSystem(block))
+        block = []
+    return chords
+
+def parseSystem(block):
+    columns = {}
+    for i, line in enumerate(block):
+        string = 5 - i
+        for match in re.finditer(r"\d+", line):
+            columns.setdefault(match.end(), []).append((string, int(match.group())))
+    return [tuple(sorted(columns[end])) for end in sorted(columns)]
+
+# MIDI notes of a chord, for comparing chords regardless of where they are played on the neck
+def chordPitches(chord, tuning, capo = 0):
+    return tuple(sorted(tuning[string] + capo + fret for string, fret in chord))
+
+# This function scores generated tabs against a reference, both as parsed by parseTabs
+# The two chord sequences are aligned on their pitches (the reference may write out repeats differently than the MIDI plays them)
+# pitchMatch:     How much of the two sequences line up (difflib ratio, 0 to 1)
+# fingering:      Of the notes in aligned chords, the share played on the same string and fret as the reference
+# exactChords:    Of the aligned chords, the share fingered exactly like the reference
+def scoreTabs(generated, reference, tuning = "standard", capo = 0):
+    tuningNotes = notes.Tunings.get(tuning, notes.Tunings["standard"])
+    generatedPitches = [chordPitches(c, tuningNotes, capo) for c in generated]
+    referencePitches = [chordPitches(c, tuningNotes, capo) for c in reference]
+    matcher = difflib.SequenceMatcher(None, generatedPitches, referencePitches, autojunk = False)
+    alignedChords = 0
+    exactChords = 0
+    alignedNotes = 0
+    sameNotes = 0
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            ours = generated[block.a + k]
+            theirs = reference[block.b + k]
+            alignedChords += 1
+            exactChords += ours == theirs
+            alignedNotes += len(theirs)
+            sameNotes += len(set(ours) & set(theirs))
+    return {
+        "generatedChords": len(generated),
+        "referenceChords": len(reference),
+        "alignedChords": alignedChords,
+        "pitchMatch": matcher.ratio(),
+        "fingering": sameNotes / alignedNotes if alignedNotes else 0.0,
+        "exactChords": exactChords / alignedChords if alignedChords else 0.0
+    }
+
+# Scores a generated tab file against a hand-made one
+def scoreFiles(generatedFile, referenceFile, tuning = "standard", capo = 0):
+    with open (generatedFile) as f:
+        generated = parseTabs(f.read())
+    with open (referenceFile) as f:
+        reference = parseTabs(f.read())
+    return scoreTabs(generated, reference, tuning, capo)
+
+# This function checks the chords detected from a recording of known chords (see synthAudio.writeChords)
+# events are (absolute tick, notes) as yielded by audioProcessing.audioEvents; Chord i starts at tick i * ticksPerChord
+# Notes detected within tolerance ticks of the start of a chord count towards it
+# Returns {chord name: {"missing": notes not detected, "extra": notes detected that are not in the chord}}
+def scoreChords(events, chords, ticksPerChord, tolerance):
+    heard = [set() for _ in chords]
+    for tick, notesToPlay in events:
+        index = round(tick / ticksPerChord)
+        if 0 <= index < len(chords) and abs(tick - index * ticksPerChord) <= tolerance:
+            heard[index].update(notesToPlay)
+    return {name: {"missing": sorted(set(chordNotes) - found), "extra": sorted(found - set(chordNotes))}
+            for (name, chordNotes), found in zip(chords, heard)}
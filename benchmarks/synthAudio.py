@@ -0,0 +1,41 @@
+import os
+import wave
+import numpy as np
+
+# Open position chords used to check the audio front end; Their octaves and fifths are real chord notes, and must not be taken as overtones
+# Each entry is (name, MIDI notes)
+Chords = [
+        ("E",        [40, 47, 52, 56, 59, 64]),
+        ("E (open)", [40, 52, 59, 64]),
+        ("A",        [45, 52, 57, 61, 64]),
+        ("A5",       [45, 57]),
+        ("G",        [43, 47, 50, 55, 59, 67]),
+        ("D",        [50, 57, 62, 66])
+]
+
+# Timbres the chords are played with, as (harmonic number, level relative to the note) pairs
+# sine:        Pure tones, all notes equally loud
+# harmonics:   A plucked string like spectrum, with harmonics falling off the way audioProcessing expects
+Timbres = {
+        "sine"      : ((1, 1.0),),
+        "harmonics" : ((1, 1.0), (2, 0.5), (3, 0.3), (4, 0.15))
+}
+
+# This function writes a 16 bit mono WAV file playing every chord for "seconds", one after the other, all notes at the same loudness
+# Every chord decays and fades out before the next one, so its attack is the only one heard at its start
+def writeChords(oFileName, chords, timbre = "sine", seconds = 1.0, sampleRate = 44100):
+    t = np.arange(int(seconds * sampleRate)) / sampleRate
+    envelope = np.exp(-3 * t) * np.minimum(1, t / 0.003) * np.minimum(1, (seconds - t) / 0.05)
+    samples = []
+    for chordNotes in chords:
+        chord = np.zeros(len(t))
+        for note in chordNotes:
+            frequency = 440 * 2 ** ((note - 69) / 12)
+            chord += sum(level * np.sin(2 * np.pi * frequency * harmonic * t) for harmonic, level in Timbres[timbre])
+        samples.append(0.08 * envelope * chord)
+    os.makedirs(os.path.dirname(oFileName) or ".", exist_ok = True)
+    with wave.open(oFileName, "wb") as oFile:
+        oFile.setnchannels(1)
+        oFile.setsampwidth(2)
+        oFile.setframerate(sampleRate)
+        oFile.writeframes((np.concatenate(samples) * 32000).astype("<i2").tobytes())
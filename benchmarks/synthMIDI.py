@@ -0,0 +1,65 @@
+import os
+import random
+import mido as m
+
+# This function generates a random (but repeatable, given the seed) MIDI file
+# bars:           Length of the song in 4/4 bars
+# chordDensity:   Chance (0 to 1) of a chord starting on each eighth note
+# maxChord:       Most notes in a single chord
+# pitchRange:     (lowest, highest) MIDI note; The default range is playable in standard tuning
+# chordSpread:    How far apart (in semitones) notes of the same chord can be
+# tracks:         Number of tracks the notes are spread over
+# jitter:         Notes are moved up to this many ticks off the grid, like a played performance
+def generateSong(seed = 0, bars = 64, chordDensity = 0.6, maxChord = 4, pitchRange = (40, 76), chordSpread = 12, tracks = 1, tpb = 480, tempo = 500000, jitter = 0):
+    rng = random.Random(seed)
+    eighth = tpb // 2
+    # (absolute tick, track, note, velocity)
+    events = []
+    for slot in range(bars * 8):
+        if rng.random() >= chordDensity:
+            continue
+        root = rng.randint(pitchRange[0], pitchRange[1])
+        top = min(root + chordSpread, pitchRange[1])
+        chordNotes = rng.sample(range(root, top + 1), min(rng.randint(1, maxChord), top - root + 1))
+        for note in chordNotes:
+            tick = max(slot * eighth + rng.randint(-jitter, jitter), 0)
+            events.append((tick, rng.randrange(tracks), note, rng.randint(40, 127)))
+
+    oFile = m.MidiFile(ticks_per_beat = tpb)
+    for track in range(tracks):
+        oTrack = m.MidiTrack()
+        oFile.tracks.append(oTrack)
+        if track == 0:
+            oTrack.append(m.MetaMessage("set_tempo", tempo = tempo, time = 0))
+        # Every note is held for an eighth; Note ons and offs are sorted together so the delta times stay positive
+        messages = []
+        for tick, eventTrack, note, velocity in events:
+            if eventTrack == track:
+                messages.append((tick, 1, m.Message("note_on", note = note, velocity = velocity)))
+                messages.append((tick + eighth - 1, 0, m.Message("note_off", note = note, velocity = 0)))
+        messages.sort(key = lambda message: (message[0], message[1]))
+        prevTick = 0
+        for tick, _, message in messages:
+            oTrack.append(message.copy(time = tick - prevTick))
+            prevTick = tick
+    return oFile
+
+# Settings for the corpus used by the timing benchmark; Each entry is (name, generateSong keyword arguments)
+Corpus = [
+        ("short",      {"bars": 16}),
+        ("medium",     {"bars": 128}),
+        ("long",       {"bars": 1024}),
+        ("dense",      {"bars": 128, "chordDensity": 1.0, "maxChord": 6, "chordSpread": 7}),
+        ("multitrack", {"bars": 128, "tracks": 4, "jitter": 20}),
+        ("wide",       {"bars": 128, "pitchRange": (28, 96)})
+]
+
+# Writes the synthetic corpus to a folder and returns the list of file names
+def writeCorpus(folder, seed = 0, corpus = Corpus):
+    os.makedirs(folder, exist_ok = True)
+    files = []
+    for i, (name, settings) in enumerate(corpus):
+        fileName = os.path.join(folder, f"{name}.mid")
+        generateSong(seed = seed + i, **settings).save(fileName)
+        files.append(fileName)
+    return files
@@ -0,0 +1,39 @@
+import contextlib
+import io
+import os
+import statistics
+import time
+import midiProcessing as mp
+import notes
+import tabProcessing as tp
+
+# Runs a function several times and returns (result of the last run, timing summary in seconds)
+def timeIt(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        # The pipeline prints a line for every unplayable note; Keep that out of the benchmark output
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        times.append(time.perf_counter() - start)
+    return result, {"min": min(times), "median": statistics.median(times), "repeats": repeats}
+
+# This function times every stage of the pipeline on a single MIDI file
+# Stages are run one after the other on the previous stage's output, the same as main.main without the streaming
+def timeFile(iFileName, oFolder, repeats = 3, tuning = "standard", maxFWidth = 5, capo = 0, maxFret = 15):
+    results = {}
+    (noteTime, tpb, tempo), results["quantizeMIDI"] = timeIt(lambda: mp.quantizeMIDI(iFileName), repeats)
+    _, results["generateNoteTable"] = timeIt(lambda: notes.generateNoteTable(tuning, maxFret, capo), repeats)
+    noteTable, results["FretTable"] = timeIt(lambda: notes.FretTable(tuning, maxFret, capo), repeats)
+    tabs, results["notesToTabs"] = timeIt(lambda: mp.notesToTabs(noteTime, tpb, tempo, noteTable, maxFWidth), repeats)
+    oTabFile = os.path.join(oFolder, os.path.splitext(os.path.basename(iFileName))[0] + ".txt")
+    _, results["tabPrettyPrint"] = timeIt(lambda: tp.tabPrettyPrint(tabs, oTabFile), repeats)
+    results["notes"] = sum(len(value) for value in noteTime.values())
+    results["chords"] = len(noteTime)
+    results["columns"] = len(tabs)
+    return results
+
+# Times every stage over a list of MIDI files; Returns {file name: results}
+def timeCorpus(files, oFolder, repeats = 3):
+    os.makedirs(oFolder, exist_ok = True)
+    return {os.path.basename(f): timeFile(f, oFolder, repeats) for f in files}
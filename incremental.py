@@ -0,0 +1,177 @@
+import hashlib
+import io
+import json
+import logging
+import numpy as np
+import notes
+import midiProcessing as mp
+import tabProcessing as tp
+import segmentSolver as ss
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the layout of the state file changes, so old state files are thrown away
+STATE_VERSION = 2
+
+# This class keeps the results of the previous run of a song, so that re-running it after an edit only redoes the parts that changed
+# The song is cut into windows of one system (line of bars) of the ASCII tab each, lined up with the systems from the first column
+# Every window is hashed by its notes and their columns relative to the start of the window; The last window also by its length, as it closes the tab
+# Windows are stored by hash, so a window that did not change is reused even if it moved (e.g. systems were added before it)
+# One stored entry holds both the solved chords of a window and, for the ASCII format, the rendered text of its system
+# Everything is kept in one JSON file next to the output (./output/<name>/segments.json), and thrown away if the settings it was made with differ
+# Only what the current run used is written back, so the file does not grow across edits
+class SegmentStore:
+    def __init__(self, path, tuning = "standard", capo = 0, maxFret = 15, maxFWidth = 5, candidates = 0, outFormat = "ascii",
+                 grid = None, columnsPerBar = 8, barsPerLine = 4):
+        tuningNotes = notes.Tunings.get(tuning, notes.Tunings["standard"])
+        self.path = path
+        self.config = (f"v{STATE_VERSION}|{','.join(str(n) for n in tuningNotes)}|{capo}|{maxFret}|{maxFWidth}|{candidates}|{outFormat}"
+                       f"|{grid}|{columnsPerBar}|{barsPerLine}")
+        self.candidates = candidates
+        self.columnsPerBar = columnsPerBar
+        self.barsPerLine = barsPerLine
+        self.width = columnsPerBar * barsPerLine
+        self.windows = {}
+        self.usedWindows = {}
+        self.layout = []
+        self.reused = 0
+        self.solved = 0
+        self.reusedSystems = 0
+        self.renderedSystems = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open (self.path) as stateFile:
+                state = json.load(stateFile)
+        except FileNotFoundError:
+            logger.info (f"No previous run found at {self.path}; Transcribing the whole song")
+            return
+        except (OSError, ValueError) as e:
+            logger.warning (f"Unable to read previous run from {self.path}: {e}; Transcribing the whole song")
+            return
+        if state.get("config") != self.config:
+            logger.info ("Settings changed since the previous run; Transcribing the whole song")
+            return
+        self.windows = state["windows"]
+        logger.info (f"Loaded previous run: {len(self.windows)} windows")
+
+    def save(self):
+        with open (self.path, "w") as stateFile:
+            stateFile.write(json.dumps({"config": self.config, "windows": self.usedWindows}, separators = (",", ":")))
+        logger.info (f"Segment results written to: {self.path}")
+
+    # Hashes a window by its notes and their columns relative to its first column; end is the length of the last window, None for the others
+    @staticmethod
+    def windowKey(relative, end = None):
+        return hashlib.sha1(json.dumps([relative, end]).encode()).hexdigest()
+
+    # This function creates tabulature like notesToTabs (or notesToTabsGlobal when candidates > 0), solving only windows not seen in the previous run
+    # With the whole-song optimizer, the candidate voicings are stored per window, and the dynamic program is run over the whole song again, so the tabs are the same as a full run
+    # With jobs, the changed windows are solved over that many worker processes (see segmentSolver.solveParallel), each with a voicing cache made from cacheSettings
+    # Returns a tabProcessing.TabMatrix
+    def transcribe(self, events, noteTable, maxFWidth, step, cache = None, jobs = 0, cacheSettings = None):
+        windows = {}
+        length = 0
+        for tick, notesToPlay in events:
+            column = tick // step
+            windows.setdefault(column // self.width, []).append((column % self.width, notesToPlay))
+            length = column + 1
+        # Windows with no notes are kept too, as their systems are still drawn; The last one (possibly empty) closes the tab
+        last = length // self.width
+        self.layout = []
+        missing = {}
+        for index in range(last + 1):
+            relative = windows.get(index, [])
+            key = self.windowKey(relative, length - index * self.width if index == last else None)
+            self.layout.append((index * self.width, key, relative))
+            if key not in self.windows and key not in missing:
+                missing[key] = relative
+
+        # Counts of freshly solved windows go straight into midiProcessing.stats; Those of reused windows are added back from the stored entry
+        if jobs > 0 and len(missing) > 1:
+            results = ss.solveParallel(list(missing.values()), noteTable, maxFWidth, 1, jobs, self.candidates, cacheSettings)
+            for _, windowStats in results:
+                if cache is not None:
+                    cache.hits += windowStats.pop("cache hits", 0)
+                    cache.misses += windowStats.pop("cache misses", 0)
+                mp.stats.update(windowStats)
+        else:
+            results = []
+            for relative in missing.values():
+                before = mp.stats.copy()
+                result = ss.solveEvents(relative, noteTable, maxFWidth, self.candidates, 1, cache)
+                results.append((result, dict(mp.stats - before)))
+        solved = {key: {"result": result, "stats": windowStats} for key, (result, windowStats) in zip(missing, results)}
+        self.solved += len(solved)
+
+        stitched = []
+        for start, key, _ in self.layout:
+            if key in solved:
+                entry = solved.pop(key)
+            else:
+                self.reused += 1
+                entry = self.usedWindows.get(key) or self.windows[key]
+                mp.stats.update(entry["stats"])
+            self.usedWindows[key] = entry
+            if self.candidates > 0:
+                stitched.extend((start + column, voicings, positions) for column, voicings, positions in entry["result"])
+            else:
+                stitched.extend((start + column, chord) for column, chord in entry["result"])
+        logger.info (f"Incremental transcription: {self.reused} windows reused, {self.solved} solved")
+        if self.candidates > 0:
+            return mp.viterbiTabs(stitched, length)
+        return tp.TabMatrix.fromChords(stitched, length)
+
+    # This function writes tabulature like tabProcessing.renderTabs, re-rendering only the systems of windows that changed since the previous run
+    # Systems are independent of each other in the ASCII layout; Other formats number their bars, so they are always rendered in full
+    # With the whole-song optimizer, the frets of a window can change with its neighbours, so its systems are kept by a hash of the frets they were rendered from
+    def render(self, tabs, oFile, format = "ascii", tuning = None, capo = 0):
+        if format != "ascii":
+            tp.renderTabs(tabs, oFile, format, self.columnsPerBar, self.barsPerLine, tuning, capo)
+            return
+        logging.info (f"Rendering tabulature as {format}, reusing unchanged systems")
+        # Systems of the previous run; Only those used by this run are kept in the entries
+        previous = {}
+        for _, key, _ in self.layout:
+            if key not in previous:
+                previous[key] = self.usedWindows[key].get("systems", {})
+                self.usedWindows[key]["systems"] = {}
+        bounds = np.searchsorted(tabs.columns, [start for start, _, _ in self.layout] + [tabs.length])
+        try:
+            with open (oFile, "w", buffering = tp.bufferSize) as tabFile:
+                for i, (start, key, _) in enumerate(self.layout):
+                    systems = self.usedWindows[key]["systems"]
+                    chords = slice(bounds[i], bounds[i + 1])
+                    frets = ""
+                    if self.candidates > 0:
+                        frets = hashlib.sha1((tabs.columns[chords] - start).tobytes() + tabs.frets[chords].tobytes()).hexdigest()
+                    text = systems.get(frets) or previous[key].get(frets)
+                    if text is None:
+                        self.renderedSystems += 1
+                        last = i == len(self.layout) - 1
+                        text = self.renderSystem(tabs, chords, start, tabs.length - start if last else self.width, last)
+                    else:
+                        self.reusedSystems += 1
+                    systems[frets] = text
+                    tabFile.write(text)
+        except OSError as e:
+            logging.error (f"Unable to write to the specified output file {oFile}: {e}")
+            raise
+        logger.info (f"Incremental rendering: {self.reusedSystems} systems reused, {self.renderedSystems} rendered")
+        logging.info (f"Successfully printed guitar tabulature to: {oFile}")
+
+    # Renders the chords of one window (a slice of the tabs, starting at column start and "length" columns long) as one system; The last system also closes the tab
+    def renderSystem(self, tabs, chords, start, length, last):
+        system = tp.TabMatrix(length, tabs.columns[chords] - start, tabs.frets[chords])
+        buffer = io.StringIO()
+        renderer = tp.AsciiRenderer(buffer, self.columnsPerBar, self.barsPerLine)
+        renderer.begin()
+        for chord in system:
+            renderer.column(chord)
+        if last:
+            renderer.end()
+        return buffer.getvalue()
+
+    def stats(self):
+        return {"windows reused": self.reused, "windows solved": self.solved, "systems reused": self.reusedSystems, "systems rendered": self.renderedSystems}
@@ -0,0 +1,190 @@
+import collections as col
+import json
+import logging
+import queue
+import socket
+import sys
+import threading
+import time
+import mido as m
+import midiProcessing as mp
+import tabProcessing as tp
+
+logger = logging.getLogger(__name__)
+
+# Defaults for live mode
+# latency:        Longest a note should wait (in seconds) from arriving to its column being sent
+# tempo:          Tempo (microseconds per beat) of the grid when listening to a port; A replayed file uses its own first tempo
+# wakeSlack:      Time allowed (in seconds) for the thread to wake up when a chord is due
+latency   = 0.05
+tempo     = 500000
+wakeSlack = 0.002
+
+# Sources put (arrival time, message) on a queue from their own thread, then None once they are done
+# Before the first message, they put (start time, None) so the grid is timed from the source's own start rather than from the first note
+# A file is replayed at real-time speed (mido's play sleeps between messages, following the tempo changes)
+def replayFile(iFileName, events):
+    inMIDI = mp.openMIDI(iFileName)
+    try:
+        events.put((time.perf_counter(), None))
+        for message in inMIDI.play():
+            events.put((time.perf_counter(), message))
+    finally:
+        events.put(None)
+
+# Listens on a virtual MIDI input port, which other programs (e.g. a DAW or a keyboard bridge) can send to; Needs the python-rtmidi backend of mido
+def openPort(name):
+    try:
+        return m.open_input(name, virtual = True)
+    except (ImportError, OSError, NotImplementedError) as e:
+        logger.error (f"Unable to open virtual MIDI port {name}: {e}")
+        raise mp.MIDIError (f"Unable to open virtual MIDI port {name} (is python-rtmidi installed?): {e}")
+
+def listenPort(port, events):
+    try:
+        events.put((time.perf_counter(), None))
+        for message in port:
+            events.put((time.perf_counter(), message))
+    finally:
+        events.put(None)
+
+# This class turns live note events into tab columns, one chord at a time
+# The grid rolls along with the clock from the source's start: A note goes to the nearest column, so arrival jitter does not push it back a column
+# Column n is n * slotSeconds (an eighth of the first tempo's beat) from the start; Offline, a tick is floored to its column instead, so notes on the grid land in the same columns
+# A chord is closed (solved and sent) when its column ends (half a slot past it), or early enough for its first note to be sent within "latency" seconds, whichever comes first
+# How early is learnt from the slowest of the last few chords (solve and send), so dense or uncached chords still make the budget
+# Notes arriving for a column that was already sent go to the next one
+# The latency of every note, from arrival to its column being sent, is kept for the report
+class LiveTabs:
+    def __init__(self, noteTable, maxFWidth, cache, oFile, slotSeconds, latency = latency, format = "ascii"):
+        self.noteTable = noteTable
+        self.maxFWidth = maxFWidth
+        self.cache = cache
+        self.oFile = oFile
+        self.slotSeconds = slotSeconds
+        self.latency = latency
+        self.format = format
+        self.start = None
+        self.lastColumn = -1
+        self.column = None
+        self.notes = []
+        self.arrivals = []
+        self.closesAt = None
+        self.latencies = []
+        self.chords = 0
+        self.closeTimes = col.deque([0.0], maxlen = 32)
+
+    # message None marks the source's start; Without one, the grid starts at the first note
+    def feed(self, arrival, message):
+        if message is None:
+            self.start = arrival
+            return
+        if message.type != "note_on" or message.velocity == 0:
+            return
+        if self.start is None:
+            self.start = arrival
+        column = max(round((arrival - self.start) / self.slotSeconds), self.lastColumn + 1)
+        if self.column is not None and column > self.column:
+            self.close()
+            column = max(column, self.lastColumn + 1)
+        if self.column is None:
+            self.column = column
+            margin = max(self.closeTimes) + wakeSlack
+            self.closesAt = min(self.start + (column + 0.5) * self.slotSeconds, arrival + self.latency - margin)
+        if message.note not in self.notes:
+            self.notes.append(message.note)
+        self.arrivals.append(arrival)
+
+    # Seconds until the open chord has to be closed, or None when there is no open chord
+    def timeout(self, now):
+        return None if self.column is None else max(self.closesAt - now, 0)
+
+    def close(self):
+        if self.column is None:
+            return
+        begin = time.perf_counter()
+        chord = mp.solveNotes(self.notes, self.noteTable, self.maxFWidth, self.cache, f"column {self.column}", quiet = True)
+        if chord is None:
+            chord = tp.REST
+        self.write(chord)
+        sent = time.perf_counter()
+        self.closeTimes.append(sent - begin)
+        self.latencies.extend(sent - arrival for arrival in self.arrivals)
+        self.chords += 1
+        self.lastColumn = self.column
+        self.column = None
+        self.notes = []
+        self.arrivals = []
+
+    # Columns are sent one per line as soon as they are solved; ascii is the column as it would appear in the tab, highest string first
+    def write(self, chord):
+        if self.format == "json":
+            line = json.dumps({"column": self.column, "notes": self.notes, "frets": list(chord)})
+        else:
+            line = f"{self.column:8} | " + " ".join(tp.fretCell(fret) for fret in reversed(chord))
+        self.oFile.write(line + "\n")
+        self.oFile.flush()
+
+    # Latency percentiles in milliseconds, and how many notes went over the budget
+    def report(self):
+        ordered = sorted(self.latencies)
+        pick = lambda p: 1000 * ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+        return {"notes": len(ordered), "chords": self.chords,
+                "p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": 1000 * ordered[-1] if ordered else 0.0,
+                "budget_ms": 1000 * self.latency, "over_budget": sum(1 for value in ordered if value > self.latency)}
+
+# This function runs live mode until the source is done (or Ctrl+C)
+# source is either a MIDI file (replayed at real-time speed) or "port:<name>" for a virtual input port
+# Columns go to stdout, or to a TCP socket when send is "<host>:<port>"
+# Returns the latency report (see LiveTabs.report)
+def runLive(source, noteTable, maxFWidth, cache, latency = latency, format = "ascii", send = None):
+    events = queue.Queue()
+    if source.startswith("port:"):
+        port = openPort(source[5:])
+        slotSeconds = tempo / 1000000 / 8
+        reader = threading.Thread(target = listenPort, args = (port, events), daemon = True)
+        logger.info (f"Listening for live MIDI on virtual port: {source[5:]}")
+    else:
+        _, tempoMap = mp.readTiming(mp.openMIDI(source))
+        slotSeconds = tempoMap[0][1] / 1000000 / 8
+        reader = threading.Thread(target = replayFile, args = (source, events), daemon = True)
+        logger.info (f"Replaying {source} at real-time speed")
+
+    connection = None
+    oFile = sys.stdout
+    if send is not None:
+        host, _, sendPort = send.rpartition(":")
+        connection = socket.create_connection((host or "127.0.0.1", int(sendPort)))
+        oFile = connection.makefile("w")
+        logger.info (f"Sending live tabs to {send}")
+
+    tabs = LiveTabs(noteTable, maxFWidth, cache, oFile, slotSeconds, latency, format)
+    reader.start()
+    try:
+        while True:
+            try:
+                item = events.get(timeout = tabs.timeout(time.perf_counter()))
+            except queue.Empty:
+                tabs.close()
+                continue
+            if item is None:
+                break
+            tabs.feed(*item)
+            if tabs.timeout(time.perf_counter()) == 0:
+                tabs.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tabs.close()
+        if connection is not None:
+            oFile.close()
+            connection.close()
+    report = tabs.report()
+    logger.info (f"Live mode finished: {report}")
+    return report
+
+def printReport(report):
+    print ("")
+    print (f"Live: {report['notes']} notes in {report['chords']} chords")
+    print (f"Latency (ms): p50 {report['p50_ms']:.1f}, p90 {report['p90_ms']:.1f}, p99 {report['p99_ms']:.1f}, max {report['max_ms']:.1f}")
+    print (f"Budget of {report['budget_ms']:.0f} ms exceeded by {report['over_budget']} notes")
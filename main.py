@@ -1,28 +1,64 @@
 import sys
-import midiProcessing as mp
-import tabProcessing as tp
-import mido as m
-import notes
 import os
 import logging
 import shutil
 import datetime
 import re
+import collections as col
 
 global tuning
 global maxFWidth
 global capo
 global tabFile
 global maxFret
+global candidates
+global cachePath
+global batchInput
+global workers
+global grid
+global minVelocity
+global relVelocity
+global ghostTicks
+global outFormat
+global profile
+global jobs
+global autoCapo
+global incremental
+global serverPort
+global liveSource
+global liveLatency
+global liveSend
+global exportMIDI
 
 tuning      = "standard"
 maxFWidth   = 5
 capo        = 0
 tabFile     = ""
 maxFret     = 15
+candidates  = 0
+cachePath   = None
+batchInput  = None
+workers     = None
+grid        = None
+minVelocity = 0
+relVelocity = 0
+ghostTicks  = 0
+outFormat   = "ascii"
+profile     = False
+jobs        = 0
+autoCapo    = None
+incremental = False
+serverPort  = None
+liveSource  = None
+liveLatency = 50
+liveSend    = None
+exportMIDI  = False
 
+# The pipeline (mido, NumPy, the note tables) is only imported once there is something to transcribe, so --help and argument errors return right away
+# -q and -o are the exception; They are checked against quantizer.Grids and tabProcessing.Renderers, so the names are only kept in one place
 # Basic logging setup; Mainly makes use of the logging module
-def loggerSetup():
+# Only info and above are logged by default, as the debug trace is large; --debug turns it on
+def loggerSetup(level = logging.INFO):
     try:
         os.mkdir(os.path.join(".", "log"))
     except FileExistsError:
@@ -37,7 +73,7 @@ def loggerSetup():
         shutil.move (os.path.join(".", "log", "error.log"), os.path.join(".","log","archive",f"error_{str(dtModDate)}.log"))
     logging.basicConfig(
     filename = os.path.join(".", "log", "error.log"),
-    level = logging.DEBUG,
+    level = level,
     style = '{',
     format = "{asctime}    [ {levelname:7} ]       {message}"
     )
@@ -45,24 +81,76 @@ def loggerSetup():
 
 # Processes all arguments; Currently only has options available for:
 # -i: Input file name
+# -b: Batch input; A folder or glob pattern of MIDI files to transcribe
+# -p: Number of worker processes for batch mode
 # -t: Tuning name
 # -f: Maximum playable fret
 # -w: Maximum finger width
 # -c: Capo position
+# -d: On-disk voicing cache shared across runs; Defaults to ./output/voicings.db
+# -q: Quantization grid (see quantizer.Grids); Uses the vectorized quantizer
+# -v: Minimum note velocity (with -q)
+# -r: Minimum velocity as a percentage of the loudest note in the chord (with -q)
+# -n: Drops notes re-triggered within this many ticks, as likely ghost notes (with -q)
+# -o: Output format (see tabProcessing.Renderers)
+# -g: Whole-song fingering optimizer, keeping the given number of candidate voicings per chord
+# -j: Solves the chords over this many worker processes
+# --auto: Scores every tuning with every capo position up to the given one (default 7) and uses the best
+# --incremental: Reuses the parts of the previous run (one system of the tab each) that did not change
+# --serve: Runs the transcription server on the given port (default 8765) instead of transcribing a file (see server.py)
+# --live: Streams tab columns as the notes come in, from the -i file replayed in real time, or from a virtual MIDI port of the given name (see live.py)
+# --latency: Longest a note waits in live mode before its column is sent, in milliseconds (default 50)
+# --send: Sends the live columns to a TCP socket (<host>:<port>) instead of stdout
+# --midi: Also writes the quantized song as quantized.mid next to the tabs
+# --profile: Reports time, memory and counts for every stage of the pipeline
+# --debug: Writes the full debug trace to the log
 def processArgs(argv):
     argvLowFlag = []
     for arg in sys.argv[1:]:
-        argvLowFlag.append(arg[0:2].lower() + arg[2:])
-    if (any("-i" in arg for arg in argvLowFlag)):
+        if arg.lower() == "--profile":
+            global profile
+            profile = True
+        elif arg.lower().startswith("--auto"):
+            global autoCapo
+            autoCapo = int(arg[6:]) if arg[6:] else 7
+        elif arg.lower() == "--incremental":
+            global incremental
+            incremental = True
+        elif arg.lower().startswith("--serve"):
+            global serverPort
+            serverPort = int(arg[7:]) if arg[7:] else 8765
+        elif arg.lower().startswith("--live"):
+            global liveSource
+            liveSource = "port:" + arg[6:] if arg[6:] else ""
+        elif arg.lower().startswith("--latency"):
+            global liveLatency
+            liveLatency = int(arg[9:])
+        elif arg.lower().startswith("--send"):
+            global liveSend
+            liveSend = arg[6:]
+        elif arg.lower() == "--midi":
+            global exportMIDI
+            exportMIDI = True
+        elif arg.lower() == "--debug":
+            logging.getLogger().setLevel(logging.DEBUG)
+        else:
+            argvLowFlag.append(arg[0:2].lower() + arg[2:])
+    if (serverPort is not None or (liveSource or "").startswith("port:") or any(arg[0:2] in ("-i", "-b") for arg in argvLowFlag)):
         for arg in argvLowFlag:
             match arg[0:2]:
                 case "-i":
                     global iFileName
                     iFileName = arg[2:]
-                    if not re.match(".*\.mid", iFileName):
-                        print (f"Error - Specified input file was not a MIDI file: {iFileName}")
-                        logging.error (f"Error - Specified input file was not a MIDI file: {iFileName}")
+                    if not re.match(".*\.(mid|wav)", iFileName):
+                        print (f"Error - Specified input file was not a MIDI or WAV file: {iFileName}")
+                        logging.error (f"Error - Specified input file was not a MIDI or WAV file: {iFileName}")
                         exit()
+                case "-b":
+                    global batchInput
+                    batchInput = arg[2:]
+                case "-p":
+                    global workers
+                    workers = int(arg[2:])
                 case "-t":
                     global tuning
                     tuning = arg[2:]
@@ -75,53 +163,278 @@ def processArgs(argv):
                 case "-c":
                     global capo
                     capo = int(arg[2:])
+                case "-d":
+                    global cachePath
+                    cachePath = arg[2:] if arg[2:] else os.path.join(".", "output", "voicings.db")
+                case "-q":
+                    global grid
+                    grid = arg[2:]
+                    import quantizer as qz
+                    if grid not in qz.Grids:
+                        print (f"Error - Unknown quantization grid: {grid}; Available grids: {', '.join(qz.Grids)}")
+                        logging.error (f"Error - Unknown quantization grid: {grid}")
+                        exit()
+                case "-v":
+                    global minVelocity
+                    minVelocity = int(arg[2:])
+                case "-r":
+                    global relVelocity
+                    relVelocity = int(arg[2:]) / 100
+                case "-n":
+                    global ghostTicks
+                    ghostTicks = int(arg[2:])
+                case "-o":
+                    global outFormat
+                    outFormat = arg[2:].lower()
+                    import tabProcessing as tp
+                    if outFormat not in tp.Renderers:
+                        print (f"Error - Unknown output format: {outFormat}; Available formats: {', '.join(tp.Renderers)}")
+                        logging.error (f"Error - Unknown output format: {outFormat}")
+                        exit()
+                case "-j":
+                    global jobs
+                    jobs = int(arg[2:])
+                case "-g":
+                    global candidates
+                    candidates = int(arg[2:]) if arg[2:] else 8
+    else:
+        print ("Error - No input specified; Use -i<input file> or -b<folder or pattern>, or run with --help for the list of options")
+        logging.error ("Error - No input file specified")
+        exit()
 
 # The main function; Basically calls all other necessary functions from beginning to end
-# 1. Quantizes the MIDI file to eighth notes
+# 1. Quantizes the MIDI file to eighth notes; WAV recordings are transcribed to notes first (see audioProcessing.py)
 # 2. Generates a bare bones MIDI file from 1
 # 3. Generates a table of playable notes according to the selected tuning, capo, playable fret, etc.
 # 4. Generates tabulature from the bare bones MIDI and the ntoe table from 3
 # 5. Pretty prints onto a new text file
-def main(iFileName, tuning = "standard", maxFWidth = 5, capo = 0, maxFret = 15):
+# noteTable/cache can be passed in to reuse them across several files (see batch.py); Otherwise they are built here
+# With incremental, windows (one tab system each) that did not change since the last run of the song are reused (see incremental.py)
+# With midi, the quantized song is also written as quantized.mid, once the tabs are done (see midiProcessing.buildMIDI)
+# outName is the folder the results are written to under ./output; Defaults to the input file name without the extension
+def main(iFileName, tuning = "standard", maxFWidth = 5, capo = 0, maxFret = 15, candidates = 0, cachePath = None, noteTable = None, cache = None, outName = None,
+         grid = None, minVelocity = 0, relVelocity = 0, ghostTicks = 0, outFormat = "ascii", profile = False, jobs = 0, incremental = False, midi = False):
+    import midiProcessing as mp
+    import tabProcessing as tp
+    import notes
+    import voicingCache as vc
+    import profiler
     # Default output format
-    global tabFile
-    if tabFile == "":
-        tabFile = os.path.join(".", "output",f"{iFileName[:-4]}", "tab.txt")
-        logging.info (f"Output file located: {tabFile}")
-    try:
-        os.mkdir(os.path.join(".", "output"))
-    except FileExistsError:
-        logging.debug (f"output folders already exist")
-        pass
-    try:
-        os.mkdir(os.path.join(".", "output", f"{iFileName[:-4]}"))
-        logging.debug (f"Created the following folder:{os.mkdir(os.path.join('.', 'output'))}")
-    except FileExistsError:
-        logging.debug (f"output folders already exist")
-        pass
+    if outName is None:
+        outName = iFileName[:-4]
+    oTabFile = tabFile
+    if oTabFile == "":
+        oTabFile = os.path.join(".", "output", f"{outName}", "tab" + tp.Renderers[outFormat].extension)
+        logging.info (f"Output file located: {oTabFile}")
+
+    # Steps 1, 4 and 5 are chained generators; Each quantized chord goes through the whole pipeline before the next one is read
+    # Step 2 (the quantized MIDI file) is optional, and only runs once the tabs are written
+    # WAV recordings have no tempo of their own; Their notes are laid out at the MIDI default of 120 bpm
+    # With a grid, the vectorized quantizer is used instead; It holds the whole song as arrays, and tab columns follow the grid slots
+    # With profile, every stage is timed (see profiler.py) and the report is printed and saved as profile.json next to the tabs
+    prof = profiler.Profiler(profile)
+    prof.begin()
+    mp.stats.clear()
+    # A bar of tabs is one beat: 8 columns of the default eighth grid, or the steps per beat of the -q grid
+    columnsPerBar = 8
+    if iFileName.lower().endswith(".wav"):
+        import audioProcessing as ap
+        if grid is not None:
+            logging.warning (f"Quantization grids only apply to MIDI input; Ignoring -q{grid}")
+        tpb, tempoMap = 480, [(0, 500000)]
+        step = int(tpb/8)
+        events = prof.iterate("quantize", ap.audioEvents(iFileName, tpb, tempoMap[0][1]))                        #1
+        with prof.stage("quantize"):
+            events = mp.requireNotes(events, iFileName)
+        if midi:
+            # The detected notes are only kept for the MIDI file when it is wanted
+            heard = []
+            events = mp.recordEvents(events, heard)
+    elif grid is None:
+        with prof.stage("read"):
+            inMIDI = mp.openMIDI(iFileName)
+            tpb, tempoMap = mp.readTiming(inMIDI)
+        step = int(tpb/8)
+        events = prof.iterate("quantize", mp.quantizeEvents(inMIDI))                                              #1
+        with prof.stage("quantize"):
+            events = mp.requireNotes(events, iFileName)
+    else:
+        import quantizer as qz
+        with prof.stage("read"):
+            inMIDI = mp.openMIDI(iFileName)
+        with prof.stage("quantize"):
+            song = qz.quantizeArrays(inMIDI, grid, minVelocity, relVelocity, ghostTicks)                        #1
+        tpb, tempoMap = song.tpb, song.tempoMap
+        events = song.slotEvents()
+        step = 1
+        columnsPerBar = qz.Grids[grid][0]
+    os.makedirs(os.path.join(".", "output", f"{outName}"), exist_ok = True)
+    with prof.stage("noteTable"):
+        if noteTable is None:
+            noteTable = notes.FretTable(iTuning = tuning, capo = capo, maxFret = maxFret)                       #3
+    ownCache = cache is None
+    if ownCache:
+        cache = vc.VoicingCache(tuning, capo, maxFret, maxFWidth, path = cachePath)
+    # Settings for the voicing caches of worker processes (-j)
+    cacheSettings = {"tuning": tuning, "capo": capo, "maxFret": maxFret, "maxFWidth": maxFWidth, "path": cachePath}
+    if incremental:
+        # Only windows that changed since the previous run are solved (over jobs workers with -j), which needs every chord up front
+        import incremental as inc
+        store = inc.SegmentStore(os.path.join(".", "output", f"{outName}", "segments.json"), tuning, capo, maxFret, maxFWidth, candidates, outFormat, grid, columnsPerBar)
+        with prof.stage("tabs"):
+            tabs = store.transcribe(list(events), noteTable, maxFWidth, step, cache, jobs, cacheSettings)        #4
+    elif jobs > 0:
+        # Chords are solved in parallel segments, which needs every chord up front
+        import segmentSolver as ss
+        with prof.stage("tabs"):
+            noteTime = col.OrderedDict(events)
+            tabs = ss.notesToTabsParallel(noteTime, noteTable, maxFWidth, step, jobs, candidates, cacheSettings)  #4
+            # The chords were looked up in the workers' voicing caches; Count them as lookups of this run
+            cache.hits += mp.stats.pop("cache hits", 0)
+            cache.misses += mp.stats.pop("cache misses", 0)
+    elif candidates > 0:
+        # The whole-song optimizer needs every chord before it can pick any of them
+        with prof.stage("tabs"):
+            noteTime = col.OrderedDict(events)
+            tabs = mp.notesToTabsGlobal (noteTime, tpb, tempoMap[0][1], noteTable, maxFWidth, candidates, cache, step)  #4
+    else:
+        tabs = prof.iterate("tabs", mp.streamTabs (events, noteTable, maxFWidth, cache, step))                  #4
+    with prof.stage("render"):
+        if incremental:
+            store.render (tabs, oTabFile, outFormat, tuning = notes.Tunings.get(tuning, notes.Tunings["standard"]), capo = capo)  #5
+            store.save()
+        else:
+            tp.renderTabs (tabs, oTabFile, outFormat, columnsPerBar, tuning = notes.Tunings.get(tuning, notes.Tunings["standard"]), capo = capo)  #5
+    if midi:
+        import quantizer as qz
+        oMIDIFile = os.path.join(".", "output", f"{outName}", "quantized.mid")
+        with prof.stage("midi"):
+            if iFileName.lower().endswith(".wav"):
+                song = qz.songFromEvents(heard, tpb, tempoMap, step)
+            elif grid is None:
+                song = qz.quantizeLegacy(inMIDI)
+            song.writeMIDI(oMIDIFile)                                                                           #2
+    prof.end()
+    if ownCache:
+        cache.close()
+        if cachePath is not None:
+            print (f"Voicing cache: {cache.stats()}")
+    else:
+        cache.flush()
+    if profile:
+        prof.count({name: mp.stats[name] for name in ("chords", "permutations", "unplayable", "rejected")})
+        prof.count({"cache hits": cache.hits, "cache misses": cache.misses})
+        if incremental:
+            prof.count(store.stats())
+        print (prof.text())
+        prof.save(os.path.join(".", "output", f"{outName}", "profile.json"))
+    print (f"Tabs successfully generated: {oTabFile}")
+    logging.info (f"Tabs successfully generated: {oTabFile}")
+
+# Picks the tuning and capo for --auto; Quantizes the song once, then ranks every configuration (see autoConfig.py)
+def autoSelect(iFileName, maxCapo, maxFret, maxFWidth, workers, grid):
+    import midiProcessing as mp
+    import autoConfig as ac
+    if iFileName.lower().endswith(".wav"):
+        import audioProcessing as ap
+        noteTime, _, _ = ap.quantizeAudio(iFileName)
+    elif grid is None:
+        noteTime, _, _ = mp.quantizeMIDI(iFileName)
+    else:
+        import quantizer as qz
+        noteTime = col.OrderedDict(qz.quantizeArrays(mp.openMIDI(iFileName), grid).slotEvents())
+    ranking = ac.rankConfigurations(noteTime, maxCapo, maxFret, maxFWidth, workers)
+    ac.printRanking(ranking)
+    best = ranking[0]
+    print (f"Using tuning {best['tuning']} with capo {best['capo']}")
+    logging.info (f"Auto selected tuning {best['tuning']} with capo {best['capo']}")
+    return best["tuning"], best["capo"]
 
-    noteTime, tpb, tempo = mp.quantizeMIDI(iFileName)                                                           #1
-    mp.generateMIDI(noteTime, tpb, tempo, oFileName = os.path.join("output", iFileName[:-4], "quantized.mid"))  #2
-    noteTable = notes.generateNoteTable(iTuning = tuning, capo = capo, maxFret = maxFret)                       #3
-    tabs = mp.notesToTabs (noteTime, tpb, tempo, noteTable, maxFWidth)                                          #4
-    tp.tabPrettyPrint (tabs, tabFile)                                                                           #5
-    print (f"Tabs successfully generated: {tabFile}")
-    logging.info (f"Tabs successfully generated: {tabFile}")
+# Runs live mode (see live.py) with the settings from the command line
+def runLive():
+    import midiProcessing as mp
+    import notes
+    import voicingCache as vc
+    import live
+    if not liveSource and "iFileName" not in globals():
+        print ("Error - Live mode needs an input file (-i) or a port name (--live<port name>)")
+        logging.error ("Error - Live mode started without an input file or port name")
+        exit()
+    if candidates > 0:
+        logging.warning ("The whole-song optimizer (-g) needs the whole song; Live mode solves chord by chord")
+    format = outFormat if outFormat in ("ascii", "json") else "ascii"
+    noteTable = notes.FretTable(iTuning = tuning, capo = capo, maxFret = maxFret)
+    cache = vc.VoicingCache(tuning, capo, maxFret, maxFWidth, path = cachePath)
+    try:
+        report = live.runLive(liveSource or iFileName, noteTable, maxFWidth, cache, liveLatency / 1000, format, liveSend)
+    except (mp.MIDIError, OSError) as e:
+        print (f"Error - {e}")
+        exit()
+    finally:
+        cache.close()
+    live.printReport(report)
 
 # Basic setup; Sets up logging and checks if there are any input variables; If not, explain to the user how to use the program
 if __name__ == "__main__":
     logger = loggerSetup()
-    if (sys.argv[1:]):
+    if (sys.argv[1:]) and not any(arg.lower() in ("-h", "--help") for arg in sys.argv[1:]):
         processArgs(sys.argv[1:])
-        main(iFileName, tuning, maxFWidth, capo, maxFret)
+        if serverPort is not None:
+            import server
+            server.runServer(serverPort, workers, cachePath)
+        elif liveSource is not None:
+            runLive()
+        elif batchInput is not None:
+            import batch
+            batch.runBatch(batchInput, workers, tuning, maxFWidth, capo, maxFret, candidates, cachePath,
+                           grid = grid, minVelocity = minVelocity, relVelocity = relVelocity, ghostTicks = ghostTicks, outFormat = outFormat, incremental = incremental, midi = exportMIDI)
+        else:
+            import midiProcessing as mp
+            try:
+                if autoCapo is not None:
+                    tuning, capo = autoSelect(iFileName, autoCapo, maxFret, maxFWidth, jobs or None, grid)
+                main(iFileName, tuning, maxFWidth, capo, maxFret, candidates, cachePath,
+                     grid = grid, minVelocity = minVelocity, relVelocity = relVelocity, ghostTicks = ghostTicks, outFormat = outFormat, profile = profile, jobs = jobs, incremental = incremental, midi = exportMIDI)
+            except (mp.MIDIError, OSError) as e:
+                print (f"Error - {e}")
+                exit()
     else:
-        print ("This script generates guitar tabulature from a MIDI file. ")
+        print ("This script generates guitar tabulature from a MIDI file (or a WAV recording). ")
         print ("The input arguments are as follows:")
-        print ("        -i<input file name>               The input MIDI file you want to generate tabulature from"     )
+        print ("        -i<input file name>               The input MIDI file you want to generate tabulature from;"    )
+        print ("                                          WAV recordings (.wav) are transcribed to notes first"         )
+        print ("        -b<folder or pattern>             Transcribes every MIDI file in a folder (or matching a glob"  )
+        print ("                                          pattern) instead of a single -i file"                         )
+        print ("        -p<workers>                       Number of worker processes for -b; Default value of one per CPU")
         print ("        -t<Tuning>                        Tuning that will be used. Can be configured in notes.py;"     )
         print ("                                          The following are available by default: standard, dropd,"     )
         print ("                                          dadgad, facgce; Default value of standard"                    )
         print ("        -f<max playable fret>             The maximum playable fret; Default value of 15"               )
         print ("        -w<max finger width>              How many frets your finger can span; Default value of 5"      )
         print ("        -c<capo>                          Capo position; Default value of 0"                            )
+        print ("        -d<cache file>                    Keeps solved chords in a file shared across runs;"            )
+        print ("                                          Default value of ./output/voicings.db"                        )
+        print ("        -q<grid>                          Snaps notes to the nearest point of a grid: 8th, 16th,"        )
+        print ("                                          triplet, swing, swing16; Can be configured in quantizer.py"   )
+        print ("        -v<min velocity>                  With -q, drops notes quieter than this; Default value of 0"   )
+        print ("        -r<percent>                       With -q, drops notes quieter than this percentage of the"     )
+        print ("                                          loudest note in the chord; Default value of 0"                )
+        print ("        -n<ticks>                         With -q, drops notes re-triggered within this many ticks;"    )
+        print ("                                          Default value of 0"                                           )
+        print ("        -o<format>                        Output format: ascii, json, musicxml; Default value of ascii" )
+        print ("        -g<candidates>                    Picks fingerings over the whole song instead of chord by chord,")
+        print ("                                          keeping this many voicings per chord; Default value of 8"     )
+        print ("        -j<workers>                       Solves the chords over this many worker processes"             )
+        print ("        --auto<max capo>                  Tries every tuning with every capo position up to this one,"  )
+        print ("                                          and uses the best; Default value of 7"                        )
+        print ("        --incremental                     Only redoes the parts of the song that changed since the last run")
+        print ("        --serve<port>                     Runs a local transcription server instead; POST a MIDI file to"  )
+        print ("                                          /tabs and read metrics from /metrics; Default port of 8765"   )
+        print ("        --live<port name>                 Streams tab columns as the notes come in; From the -i file"   )
+        print ("                                          replayed in real time, or from a virtual MIDI port if named"  )
+        print ("        --latency<ms>                     Longest a note waits in live mode; Default value of 50"       )
+        print ("        --send<host:port>                 Sends the live columns to a TCP socket instead of stdout"     )
+        print ("        --midi                            Also writes the quantized song to quantized.mid"              )
+        print ("        --profile                         Reports time, memory and counts for every stage"              )
+        print ("        --debug                           Writes the full debug trace to log/error.log"                 )
         logging.info ("Exited without an input file")
\ No newline at end of file
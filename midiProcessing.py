@@ -3,207 +3,419 @@ import math
 import collections as col
 import notes
 import itertools
+import heapq
+import io
 import logging
+import struct
+import numpy as np
 import tabProcessing as tp
 
 logger = logging.getLogger(__name__)
 
+# Running counts kept by the pipeline for profiling (see profiler.py); Reset with stats.clear()
+# chords:        Chords sent to the solver (or voicing cache)
+# permutations:  Fingerings tried by the backtracking solver
+# unplayable:    Notes that can not be played with the current tuning/capo/etc.
+# rejected:      Chords with no playable fingering
+stats = col.Counter()
+
+# Raised when an input MIDI file can not be read or has nothing to transcribe
+class MIDIError(Exception):
+    pass
+
 # This function generates a MIDI file from an input noteTime dictionary. This dictionary has the number of absolute ticks as the key and the notes to play at that tick as the value
-# This has so far been untested for multi-track MIDIs
+# tempo is either a single tempo for the whole song, or a tempo map as returned by readTiming
+# As noteTime holds no velocity or duration, every note is played at full velocity and held for an eighth of a beat (see buildMIDI)
 def generateMIDI(noteTime, tpb, tempo, oFileName):
-    logger.info ("Generating cleaned MIDI file for future reference")
+    ticks = [key for key, value in noteTime.items() for _ in value]
+    pitches = [note for value in noteTime.values() for note in value]
+    buildMIDI(ticks, pitches, [127] * len(pitches), [max(int(tpb/8), 1)] * len(pitches), tpb, tempo, oFileName)
 
-    # It is assumed that the tempo is the same throughout the entire song
-    oFile = m.MidiFile(ticks_per_beat=tpb)
-    oTrack = m.MidiTrack()
-    oFile.tracks.append(oTrack)
-    oTrack.append(m.Message('program_change', channel=0, program=0, time=0))
-    oTrack.append(m.MetaMessage('set_tempo', tempo=tempo, time=0))
+# This function builds a MIDI file from parallel arrays of notes in one pass, and writes it with a single buffered save
+# ticks/pitches/velocities/durations hold one entry per note (absolute tick of the note on, MIDI note, velocity, length in ticks), in any order
+# A note is cut short where the next note of the same pitch starts, so notes never overlap; Every note lasts at least one tick
+# The track is encoded straight from the arrays (variable length delta times included), without building a mido message per note
+# tempo is either a single tempo for the whole song, or a tempo map as returned by readTiming
+def buildMIDI(ticks, pitches, velocities, durations, tpb, tempo, oFileName):
+    logger.info ("Generating quantized MIDI file")
+    tempoMap = tempo if isinstance(tempo, list) else [(0, tempo)]
+    ticks = np.asarray(ticks, dtype = np.int64)
+    pitches = np.asarray(pitches, dtype = np.int64)
+    velocities = np.asarray(velocities, dtype = np.int64)
+    durations = np.maximum(np.asarray(durations, dtype = np.int64), 1)
 
-    # As we are generating simple tabulature, note duration/velocity are not taken into account
-    prevKey = 0
-    absTicks = 0
+    byPitch = np.lexsort((ticks, pitches))
+    nextOn = np.full(len(ticks), np.iinfo(np.int64).max)
+    samePitch = pitches[byPitch][1:] == pitches[byPitch][:-1]
+    nextOn[byPitch[:-1][samePitch]] = ticks[byPitch][1:][samePitch]
+    ends = np.minimum(ticks + durations, nextOn)
+    # Repeats of a note on the same tick are written once
+    keep = ends > ticks
+    ticks, pitches, velocities, ends = ticks[keep], pitches[keep], velocities[keep], ends[keep]
 
-    # Generates a basic MIDI file for future reference/editing
-    for key, value in noteTime.items():
-        logger.debug ("------------------------------------------------------------------------------")
-        tickDiff = int(key - prevKey)
-        absTicks += tickDiff
-
-        # Generate a "note on" message for each note to play at the current tick value
-        logger.debug (f"| Current Tick (abs) | Previous Tick (abs) | Tick Difference | Notes to Play |")
-        logger.debug (f"| {absTicks:18} | {prevKey:19} | {tickDiff:15} | {str(value):13} |")
-        for i, mNote in enumerate(value):
-            oTrack.append(m.Message("note_on", note=mNote, velocity=127, time=tickDiff))
-            pString = f"| note_on channel=0 note={mNote} velocity=127 time={tickDiff})"
-            logger.debug (f"{pString:76} |")
-            tickDiff = 0
-
-        # Generate a "note off" message an eighth of a measure after the note on
-        tickDiff = int(_8th)
-        absTicks += tickDiff
-        for mNote in value:
-            oTrack.append(m.Message("note_off", note=mNote, velocity=127, time=tickDiff))
-            pString = f"| note_off channel=0 note={mNote} velocity=127 time={tickDiff})"
-            logger.debug (f"{pString:76} |")
-            tickDiff = 0
-        prevKey = key + _8th
-    
-    # Finished generating all notes, end the track and clean up
-    pString = f"| MetaMessage('end_of_track', time=0)"
-    logger.debug (f"{pString:76} |")
-    logger.debug ("------------------------------------------------------------------------------")
-    oFile.save(oFileName)
-    logger.info (f"Successfully generated quantized MIDI file: {oFileName}")
+    # Every event is (tick, priority, up to 6 bytes of message); At the same tick note offs go first, then tempo changes, then note ons
+    tempoTicks = np.array([tick for tick, _ in tempoMap], dtype = np.int64)
+    tempos = np.array([value for _, value in tempoMap], dtype = np.int64)
+    count = len(ticks)
+    eventTicks = np.concatenate(([0], ends, tempoTicks, ticks))
+    priority = np.concatenate(([0], np.zeros(count), np.ones(len(tempos)), np.full(count, 2)))
+    payload = np.zeros((len(eventTicks), 6), dtype = np.int64)
+    lengths = np.concatenate(([2], np.full(count, 3), np.full(len(tempos), 6), np.full(count, 3)))
+    payload[0, :2] = (0xC0, 0)
+    offs = slice(1, 1 + count)
+    payload[offs, 0], payload[offs, 1] = 0x80, pitches
+    changes = slice(1 + count, 1 + count + len(tempos))
+    payload[changes, :3] = (0xFF, 0x51, 0x03)
+    payload[changes, 3], payload[changes, 4], payload[changes, 5] = tempos >> 16, (tempos >> 8) & 0xFF, tempos & 0xFF
+    ons = slice(1 + count + len(tempos), None)
+    payload[ons, 0], payload[ons, 1], payload[ons, 2] = 0x90, pitches, velocities
+
+    order = np.lexsort((priority, eventTicks))
+    eventTicks, payload, lengths = eventTicks[order], payload[order], lengths[order]
+    deltas = np.diff(eventTicks, prepend = 0)
+
+    # Variable length delta times: 7 bits per byte, most significant first, with the top bit set on every byte but the last
+    groups = np.stack([(deltas >> (7 * k)) & 0x7F for k in (3, 2, 1, 0)], axis = 1)
+    groups[:, :3] |= 0x80
+    sizes = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    rows = np.concatenate((groups, payload), axis = 1)
+    mask = np.concatenate((np.arange(4)[None, :] >= 4 - sizes[:, None], np.arange(6)[None, :] < lengths[:, None]), axis = 1)
+    track = rows[mask].astype(np.uint8).tobytes() + b"\x00\xff\x2f\x00"
+
+    with open (oFileName, "wb") as oFile:
+        oFile.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, tpb) + b"MTrk" + struct.pack(">I", len(track)) + track)
+    logger.info (f"Successfully generated quantized MIDI file: {oFileName} ({count} notes)")
+
+# Weights used by the whole-song fingering optimizer (notesToTabsGlobal)
+# SHIFT_WEIGHT:       Cost per fret the hand has to move between two chords
+# STRING_WEIGHT:      Cost per string that starts or stops being played between two chords
+# SPAN_WEIGHT:        Cost per fret of stretch within a chord
+# FRET_WEIGHT:        Cost per fret of hand position up the neck; Prefers playing closer to the nut
+# OPEN_BONUS:         Reward for every open string in a chord
+# RANK_WEIGHT:        Cost per place a voicing sits below the first choice; Keeps the noteTable preference ordering as a tie breaker
+SHIFT_WEIGHT  = 1.0
+STRING_WEIGHT = 0.1
+SPAN_WEIGHT   = 0.5
+FRET_WEIGHT   = 0.2
+OPEN_BONUS    = 0.5
+RANK_WEIGHT   = 0.1
+
+# This function goes through every playable way to fret a chord using a backtracking search
+# Notes are assigned one at a time in the order they appear in the chord, trying each fingering in the noteTable preference order
+# Every assignment is checked against the strings already in use and the finger width straight away, and the branch is abandoned on the first conflict
+# Voicings are yielded in the same order as the Cartesian product of all fingerings, as a list of 6 frets (-1 meaning the string is not played)
+def chordVoicings(notesToPlay, noteTable, maxFWidth):
+    # Repeated notes only need to be played once
+    chordNotes = list(dict.fromkeys(notesToPlay))
+    if len(chordNotes) > 6:
+        return
+
+    # Each fingering is a (string index, fret) pair; notes.FretTable has these decoded already
+    fingerings = []
+    for note in chordNotes:
+        choices = notes.noteFingerings(noteTable, note)
+        if not choices:
+            return
+        fingerings.append(choices)
+
+    chord = [-1, -1, -1, -1, -1, -1]
+
+    def place(depth, lowestFinger, highestFinger):
+        if depth == len(fingerings):
+            yield list(chord)
+            return
+        for noteCString_i, noteCFret in fingerings[depth]:
+            stats["permutations"] += 1
+            # Multiple notes on the same string; Invalid
+            if chord[noteCString_i] >= 0:
+                continue
+            low, high = lowestFinger, highestFinger
+            if noteCFret != 0:
+                low = min(noteCFret, low)
+                high = max(noteCFret, high)
+                # Notes are too far apart; Invalid
+                if high - low > maxFWidth:
+                    continue
+            chord[noteCString_i] = noteCFret
+            yield from place(depth + 1, low, high)
+            chord[noteCString_i] = -1
+
+    yield from place(0, 999, -1)
+
+# This function finds the first playable way to fret a chord, i.e. the same chord the brute force search would accept
+# Returns a list of 6 frets (-1 meaning the string is not played), or None if there is no playable way to fret the chord
+def solveChord(notesToPlay, noteTable, maxFWidth):
+    return next(chordVoicings(notesToPlay, noteTable, maxFWidth), None)
+
+# This function returns up to the first k playable voicings of a chord, in noteTable preference order
+def chordCandidates(notesToPlay, noteTable, maxFWidth, k):
+    return list(itertools.islice(chordVoicings(notesToPlay, noteTable, maxFWidth), k))
+
+# This function solves one chord for every path that turns chords into tabs (streamTabs, chordSteps, segmentSolver and live mode)
+# Notes that can not be played with the current tuning/capo/etc. are counted and reported, with "where" (tick or column) in the log; quiet keeps them off stdout (live mode writes the tabs there)
+# Returns the first playable voicing, or with candidates > 0, a list of up to that many voicings in noteTable preference order; None if the chord has no playable fingering
+# If a voicingCache.VoicingCache is given, the chord is looked up there before being solved
+def solveNotes(notesToPlay, noteTable, maxFWidth, cache = None, where = None, candidates = 0, quiet = False):
+    for note in notesToPlay:
+        if note not in noteTable:
+            stats["unplayable"] += 1
+            if not quiet:
+                print (f"Found an unplayable note: {note}; Omitting from tab")
+            logger.info (f"Found an unplayable note: {note} at {where}; Omitting from tab")
+    stats["chords"] += 1
+    if candidates > 0:
+        result = (cache.candidates(notesToPlay, noteTable, candidates) if cache is not None
+                  else chordCandidates(notesToPlay, noteTable, maxFWidth, candidates)) or None
+    elif cache is not None:
+        result = cache.solve(notesToPlay, noteTable)
+    else:
+        result = solveChord(notesToPlay, noteTable, maxFWidth)
+    if result is None:
+        stats["rejected"] += 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug (f"REJECTED - No playable chord for notes: {str(notesToPlay)} at {where}")
+    return result
+
+# Hand position of a voicing; The average fretted (non open) fret, or None if only open strings are played
+def handPosition(chord):
+    fretted = [fret for fret in chord if fret > 0]
+    if not fretted:
+        return None
+    return sum(fretted) / len(fretted)
+
+# Cost of playing a voicing on its own; Wide stretches and high positions cost more, open strings are cheaper
+def voicingCost(chord, rank):
+    fretted = [fret for fret in chord if fret > 0]
+    span = (max(fretted) - min(fretted)) if fretted else 0
+    position = (sum(fretted) / len(fretted)) if fretted else 0
+    openStrings = chord.count(0)
+    return SPAN_WEIGHT * span + FRET_WEIGHT * position - OPEN_BONUS * openStrings + RANK_WEIGHT * rank
+
+# Cost of moving from one voicing to the next; Moving the hand up/down the neck and changing which strings are played
+def transitionCost(prevChord, prevPos, chord, pos):
+    shift = 0 if (prevPos is None or pos is None) else abs(pos - prevPos)
+    stringChanges = sum(1 for a, b in zip(prevChord, chord) if (a < 0) != (b < 0))
+    return SHIFT_WEIGHT * shift + STRING_WEIGHT * stringChanges
 
 # This function creates tabulature using the generated MIDI file from generateMIDI
-def notesToTabs(noteTime, tpb, tempo, noteTable, maxFWidth):
-    # Creates a list of tabs to play up to the very end of the generated MIDI file
-    # These tabs are initialized to -1, meaning no note being played, and get filled in throughout the function
+# If a voicingCache.VoicingCache is given, chords are looked up there before being solved
+# Returns a tabProcessing.TabMatrix, which only stores the columns where something is played
+def notesToTabs(noteTime, tpb, tempo, noteTable, maxFWidth, cache = None):
+    return tp.TabMatrix.fromColumns(streamTabs(noteTime.items(), noteTable, maxFWidth, cache))
+
+# This function creates tabulature one eighth at a time from (absolute tick, notes) events in increasing tick order
+# Yields the tab for every eighth from the start of the song up to the last event, as 6 frets (-1 meaning no note being played); Rests are tabProcessing.REST
+# Only the current chord is held in memory, so the events can come straight from quantizeEvents
+# step is the number of ticks per tab column; Defaults to the _8th grid, use 1 for events keyed by grid slot (see quantizer.py)
+def streamTabs(events, noteTable, maxFWidth, cache = None, step = None):
     logger.info ("Generating guitar tabulature from MIDI file")
+    if step is None:
+        step = _8th
+    nextTick = 0
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for chordTime, notesToPlay in events:
+        chordTick = chordTime//step
+        # Eighths with no notes to play are rests
+        while nextTick < chordTick:
+            yield tp.REST
+            nextTick += 1
+
+        # Attempts to find a way to play all the notes on the current tick
+        if debug:
+            logger.debug ("------------------------------------------------------------------------------")
+            logger.debug (f"Found a note to play at absolute tick: {chordTime}")
+        
+        chord = solveNotes(notesToPlay, noteTable, maxFWidth, cache, chordTime)
+        if chord is None:
+            chord = tp.REST
+        elif debug:
+            logger.debug (f"ACCEPTED - Possible chord: {str(chord):30}")
+            logger.debug (f"Generated tab as follows:")
+            tp.tabPrettyPrintChord(chord)
+        yield chord
+        nextTick = chordTick + 1
+    if debug:
+        logger.debug ("------------------------------------------------------------------------------")
+    logger.info ("Successfully generated guitar tabulature")
+
+# This function creates tabulature like notesToTabs, but picks the fingering of each chord by looking at the whole song instead of one chord at a time
+# For every chord, up to the first "candidates" voicings (in noteTable preference order) are kept
+# A dynamic program (Viterbi) then finds the sequence of voicings with the lowest total cost, as set by the weights at the top of this file
+# The cost is linear in the length of the song: Each chord only compares its candidates against the candidates of the chord before it
+# step is the number of ticks per tab column, as in streamTabs
+def notesToTabsGlobal(noteTime, tpb, tempo, noteTable, maxFWidth, candidates = 8, cache = None, step = None):
+    logger.info (f"Generating guitar tabulature from MIDI file (whole-song optimizer, {candidates} candidates per chord)")
+    if step is None:
+        step = _8th
     lastNT = list(noteTime.keys())[-1]
-    tabs = [[-1,-1,-1,-1,-1,-1] for i in range(0,lastNT+1,_8th)]
-    playableStrings = [True * 6]
-    
-    # Takes eighth steps up to the very last eighth of the song. If no strings are to be played (as per the keys in noteTime), then skip, otherwise go through the else block
-    for i in range (0, lastNT + 1, _8th):
-        chordTime = i
-        chordTick = chordTime//_8th
-        if i not in noteTime:
-            pass
-        else:
-            # This else block attempts to find a way to play all the notes on the current tick
-            logging.debug ("------------------------------------------------------------------------------")
-            logging.debug (f"Found a note to play at absolute tick: {chordTime}")
-            playableStrings = [True, True, True, True, True, True]
-            notesToPlay = noteTime[chordTime]
-            possFingering = {}
-            for index, value in enumerate(notesToPlay):
-                possFingering[value] = []
-            
-            # Make sure that the current note is actually playable with the current tuning/capo/etc.
-            for note in notesToPlay:
-                try:
-                    possFingering[note] = noteTable[note]
-                except:
-                    print (f"Found an unplayable note: {note}; Omitting from tab")
-                    logging.info (f"Found an unplayable note: {note} at {chordTime}; Omitting from tab")
-
-            # Takes the Cartesian product (all possible combinations) of all notes to play and all of their possible fingerings/ways to play them
-            # For each permutation, check if it's already been covered (in a playable way)
-            # If not, check if all the notes using the current permutation is playable (according to finger width, strings available, etc.)
-            # If so add it to the tab and go to the next chord to play
-            # If not, check the next permutation after resetting
-            perms = [dict(zip(possFingering, v)) for v in itertools.product(*possFingering.values())]
-            for possChord in perms:
-                # For some reason, trying to find a way to play a tab that was already generated, skip
-                if (tabs [chordTick] != [-1,-1,-1,-1,-1,-1]):
-                    logging.debug (f"Already found a playable chord; going to the next chord to play")
-                    break
-                lowestFinger = 999
-                highestFinger = -1
-                noteCount = 0
-                for midiNote, noteChoice in possChord.items():
-                    # The encoding is as follows (more information in notes.py:
-                    # 301 -> 3 01 -> 1st fret on the 3rd string
-                    noteCString_i = (noteChoice // 100) - 1
-                    noteCFret = noteChoice % 100
-                    
-                    # The current permutation plays multiple notes on the same string; Invalid
-                    if not playableStrings[noteCString_i]:
-                        playableStrings = [True, True, True, True, True, True]
-                        tabs [chordTick] = [-1,-1,-1,-1,-1,-1]
-                        noteCount = 0
-                        logging.debug (f"REJECTED - Possible chord: {str(possChord):30} Conflicting strings")
-                        break
-
-                    if noteCFret != 0:
-                        lowestFinger = min(noteCFret, lowestFinger)
-                        highestFinger = max(noteCFret, highestFinger)
-                        # The current permutation plays notes that are too far apart; Invalid
-                        if (highestFinger - lowestFinger > maxFWidth):
-                            noteCount = 0
-                            playableStrings = [True, True, True, True, True, True]
-                            tabs [chordTick] = [-1,-1,-1,-1,-1,-1]
-                            logging.debug (f"REJECTED - Possible chord: {str(possChord):30} Finger Width too small")
-                            break
-                    
-                    # Atleast for now, all seen notes are playable simultaneously
-                    tabs [chordTick][noteCString_i] = noteCFret
-                    playableStrings[noteCString_i] = False
-                    noteCount += 1
-
-                    # The tab is only fully accepted when the amount of notes to play == amount of string played
-                    if (noteCount >= len(possChord.items())):
-                        logging.debug (f"ACCEPTED - Possible chord: {str(possChord):30}")
-                        logging.debug (f"Generated tab as follows:")
-                        tp.tabPrettyPrintChord(tabs[chordTick])
-                        break
-    logging.debug ("------------------------------------------------------------------------------")
+    steps = chordSteps(noteTime.items(), noteTable, maxFWidth, candidates, cache, step)
+    tabs = viterbiTabs(steps, lastNT//step + 1)
     logger.info ("Successfully generated guitar tabulature")
     return tabs
 
-# This function "cleans" the input MIDI file. Note that behavior is unexpected for multi-track MIDIs
-# Currently, it is limited to checking for when notes are triggered and mapping each note to the nearest 8th. The main return value is the noteTime table
-# This is a dictionary with the keys as the absolute time (in ticks), and value as the notes to play on that tick
-# Future plans include:
-# 1. Checking when notes are too close to each other and filtering them out, as they were likely false triggers
-# 2. Comparing note velocities and making it s.t. notes too qutie from the current loudest are filtered out
-def quantizeMIDI (iFileName):
-    logger.info ("Quantize input MIDI file")
+# This function collects the candidate voicings of every chord for the whole-song optimizer, from (absolute tick, notes) events
+# Returns a list of (chordTick, voicings, hand positions); Unplayable chords are left out and stay as rests in the tab
+def chordSteps(events, noteTable, maxFWidth, candidates, cache = None, step = None):
+    if step is None:
+        step = _8th
+    steps = []
+    for i, notesToPlay in events:
+        voicings = solveNotes(notesToPlay, noteTable, maxFWidth, cache, i, candidates)
+        if voicings is None:
+            continue
+        steps.append((i//step, voicings, [handPosition(v) for v in voicings]))
+    return steps
+
+# This function runs the dynamic program (Viterbi) of the whole-song optimizer over the steps from chordSteps
+# Returns a tabProcessing.TabMatrix with "length" columns
+def viterbiTabs(steps, length):
+    if not steps:
+        return tp.TabMatrix.fromChords([], length)
 
-    tempo = -1
-    tpb = -1
-    noteTime = col.OrderedDict()
-    currNotes = {}
+    # Forward pass; cost[j] is the cheapest way to reach voicing j of the current chord, back[n][j] is the voicing of the previous chord it came from
+    # handAt[j] is where the hand is after playing voicing j; Chords with only open strings leave the hand where it was
+    _, voicings, positions = steps[0]
+    cost = [voicingCost(v, rank) for rank, v in enumerate(voicings)]
+    handAt = list(positions)
+    back = [None]
+    for n in range (1, len(steps)):
+        prevVoicings = steps[n - 1][1]
+        _, voicings, positions = steps[n]
+        newCost = []
+        newHandAt = []
+        newBack = []
+        for rank, (chord, pos) in enumerate(zip(voicings, positions)):
+            best = min(range(len(prevVoicings)), key = lambda p: cost[p] + transitionCost(prevVoicings[p], handAt[p], chord, pos))
+            newCost.append(cost[best] + transitionCost(prevVoicings[best], handAt[best], chord, pos) + voicingCost(chord, rank))
+            newHandAt.append(handAt[best] if pos is None else pos)
+            newBack.append(best)
+        cost = newCost
+        handAt = newHandAt
+        back.append(newBack)
 
-    # Tries to open the specified MIDI file
+    # Backward pass; Follows the cheapest path back to the first chord and fills in the tab
+    j = min(range(len(cost)), key = lambda c: cost[c])
+    chosen = [None] * len(steps)
+    for n in range (len(steps) - 1, -1, -1):
+        chordTick, voicings, _ = steps[n]
+        chosen[n] = (chordTick, voicings[j])
+        j = back[n][j] if n > 0 else j
+    return tp.TabMatrix.fromChords(chosen, length)
+
+# This function opens a MIDI file
+# Errors are raised as MIDIError so that the caller can decide whether to stop (single file) or move on (batch)
+def openMIDI (iFileName):
     try:
-        inMIDI = m.MidiFile(f"{iFileName}", clip = True)
+        return m.MidiFile(f"{iFileName}", clip = True)
     except FileNotFoundError:
         logger.error (f"Unable to find specified file: {iFileName}")
-        print (f"Error - Unable to find specified file: {iFileName}")
-        exit()
-    except:
-        logger.error (f"Unknown error occured while opening the specified MIDI file")
-        print ("Unknown error occured while opening the specified MIDI file")
-        exit()
-
-    for i, track in enumerate(inMIDI.tracks):
-        # Initializes some variables based on the input
+        raise MIDIError (f"Unable to find specified file: {iFileName}")
+    except Exception as e:
+        logger.error (f"Unknown error occured while opening the specified MIDI file: {iFileName}: {e}")
+        raise MIDIError (f"Unknown error occured while opening the specified MIDI file: {iFileName}") from e
+
+# This function opens a MIDI file held in memory (e.g. the body of a request to the transcription server)
+def openMIDIBytes (data):
+    try:
+        return m.MidiFile(file = io.BytesIO(data), clip = True)
+    except Exception as e:
+        logger.error (f"Unable to read MIDI data ({len(data)} bytes): {e}")
+        raise MIDIError (f"Unable to read MIDI data: {e}") from e
+
+# This function reads the timing information of an opened MIDI file and sets up the quantization grid (_8th/_16th)
+# Returns the ticks per beat and the tempo map, a list of (absolute tick, tempo) for every set_tempo message across all tracks
+# If the song does not set a tempo before its first note, the MIDI default of 500000 (120 bpm) is used up to the first change
+def readTiming (inMIDI):
+    tpb = inMIDI.ticks_per_beat
+    setGrid(tpb)
+    logger.info (f"ticks_per_beat: {tpb}")
+
+    tempoMap = []
+    for absTicks, _, message in mergeTracks(inMIDI):
+        if message.is_meta and message.type == "set_tempo":
+            tempoMap.append((absTicks, message.tempo))
+    if not tempoMap or tempoMap[0][0] > 0:
+        tempoMap.insert(0, (0, 500000))
+    logger.info (f"Tempo set to: {tempoMap[0][1]}")
+    if len(tempoMap) > 1:
+        logger.info (f"Found {len(tempoMap) - 1} tempo changes")
+    return tpb, tempoMap
+
+# Sets up the quantization grid (_8th/_16th) for a song with the given ticks per beat
+def setGrid (tpb):
+    global _8th
+    global _16th
+    _8th = int((tpb/8))
+    _16th = int((tpb/16))
+
+# This function lazily merges all tracks of a MIDI file into one stream ordered by absolute tick
+# Yields (absolute tick, track index, message); Messages on the same tick keep their track order, then their order within the track
+def mergeTracks (inMIDI):
+    def trackEvents(index, track):
         absTicks = 0
-        tpb = inMIDI.ticks_per_beat
-        global _8th
-        _8th = int((tpb/8))
-        global _16th
-        _16th = int((tpb/16))
-        logger.info (f"ticks_per_beat: {tpb}")
-
-        # Each MIDI file consists of several tracks, each with several messages. In this case, we mostly only care about note_on except for a couple of exceptions
         for message in track:
             absTicks += message.time
-            if (message.is_meta) and tempo < 0 and message.type == "set_tempo":
-                tempo = message.tempo
-                logger.info (f"Tempo set to: {tempo}")
-            
-            # For every note_on message we have, we change the timing to the nearest eight note according to the variables set earlier
-            # After finding the nearest eight, add it to the noteTime dictionary
-            if (message.type == "note_on"):
-                # Default tempo
-                if (tempo < 0):
-                    tempo = 500000
-                if absTicks%_8th <= _16th:
-                    m_absTicks = int((absTicks//_8th)*_8th)
-                else:
-                    m_absTicks = int(math.ceil(absTicks//_8th)*_8th)
-                currNotes = noteTime.setdefault(m_absTicks, [])
-                currNotes.append(message.note)
-                noteTime[m_absTicks] = currNotes
-    logger.debug ("The input MIDI file has generated the following table")
-    logger.debug ("|  Absolute ticks   |   Notes to Play (MIDI)   |")
-    for time, value in noteTime.items():
-        valString = str(value)
-        logger.debug (f"|{time : 17}  |  {valString:24}|")
+            yield absTicks, index, message
+    return heapq.merge(*(trackEvents(i, track) for i, track in enumerate(inMIDI.tracks)), key = lambda event: (event[0], event[1]))
+
+# Moves an absolute tick onto the eighth grid
+def snapTick (absTicks):
+    if absTicks%_8th <= _16th:
+        return int((absTicks//_8th)*_8th)
+    return int(math.ceil(absTicks//_8th)*_8th)
+
+# This function "cleans" an opened MIDI file, one quantized tick at a time
+# All tracks are merged in time order, and every note that is triggered is mapped to the nearest 8th
+# Yields (absolute tick, notes to play on that tick) in increasing tick order, so only the current chord is ever held in memory
+# Note that note_on messages with a velocity of 0 are note offs, and are skipped
+def quantizeEvents (inMIDI):
+    currTick = -1
+    currNotes = []
+    for absTicks, _, message in mergeTracks(inMIDI):
+        # For every note_on message we have, we change the timing to the nearest eight note
+        if message.type == "note_on" and message.velocity > 0:
+            m_absTicks = snapTick(absTicks)
+            if m_absTicks != currTick and currNotes:
+                yield currTick, currNotes
+                currNotes = []
+            currTick = m_absTicks
+            currNotes.append(message.note)
+    if currNotes:
+        yield currTick, currNotes
+
+# Passes a stream of quantized events through, keeping a copy of every event in recorded
+def recordEvents (events, recorded):
+    for event in events:
+        recorded.append(event)
+        yield event
+
+# Makes sure a stream of quantized events has at least one note, without consuming it
+# Raises MIDIError if there is nothing to transcribe
+def requireNotes (events, iFileName):
+    first = next(events, None)
+    if first is None:
+        logger.error (f"No notes found in the specified MIDI file: {iFileName}")
+        raise MIDIError (f"No notes found in the specified MIDI file: {iFileName}")
+    return itertools.chain([first], events)
+
+# This function "cleans" the input MIDI file by collecting everything from quantizeEvents. The main return value is the noteTime table
+# This is a dictionary with the keys as the absolute time (in ticks), and value as the notes to play on that tick, in increasing tick order
+# Future plans include:
+# 1. Checking when notes are too close to each other and filtering them out, as they were likely false triggers
+# 2. Comparing note velocities and making it s.t. notes too qutie from the current loudest are filtered out
+def quantizeMIDI (iFileName):
+    logger.info ("Quantize input MIDI file")
+
+    inMIDI = openMIDI(iFileName)
+    tpb, tempoMap = readTiming(inMIDI)
+    noteTime = col.OrderedDict(requireNotes(quantizeEvents(inMIDI), iFileName))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug ("The input MIDI file has generated the following table")
+        logger.debug ("|  Absolute ticks   |   Notes to Play (MIDI)   |")
+        for time, value in noteTime.items():
+            valString = str(value)
+            logger.debug (f"|{time : 17}  |  {valString:24}|")
     logger.info ("MIDI file successfully quantized")
 
-    return noteTime, tpb, tempo
\ No newline at end of file
+    return noteTime, tpb, tempoMap[0][1]
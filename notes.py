@@ -1,4 +1,5 @@
 import collections as col
+import numpy as np
 
 # Tunings are stored in an array of length 6 (one for each string); In this case, index 0 is the lowest string/one closest to the user
 # Tunings can be added by matching MIDI notes to the open string
@@ -34,7 +35,33 @@ def generateNoteTable(iTuning = "standard", maxFret = 15, capo = 0):
         fretting.sort(key = lambda x:x%100)
     return noteTable
 
-# Not currently being used; Will be used when mp3 inputs are accepted for audio processing
+# Array-backed version of the note table; Built from the same preference ordering as generateNoteTable, but decoded once up front
+# candidates: For every MIDI note, a tuple of (string index, fret) pairs in preference order (open strings first); Used by the chord solver
+class FretTable:
+    def __init__(self, iTuning = "standard", maxFret = 15, capo = 0):
+        noteTable = generateNoteTable(iTuning, maxFret, capo)
+        candidates = [()] * 128
+        for note, fretting in noteTable.items():
+            if 0 <= note < 128:
+                candidates[note] = tuple(((choice // 100) - 1, choice % 100) for choice in fretting)
+        self.candidates = tuple(candidates)
+
+    # A note is playable if there is at least one way to fret it
+    def __contains__(self, note):
+        return 0 <= note < 128 and len(self.candidates[note]) > 0
+
+    def fingerings(self, note):
+        if 0 <= note < 128:
+            return self.candidates[note]
+        return ()
+
+# Returns the (string index, fret) pairs for a note in preference order, from either a FretTable or a generateNoteTable dictionary
+def noteFingerings(noteTable, note):
+    if isinstance(noteTable, FretTable):
+        return noteTable.fingerings(note)
+    return [((choice // 100) - 1, choice % 100) for choice in noteTable.get(note, ())]
+
+# Frequency (Hz) of every MIDI note; Used by the audio front end (see frequenciesToMIDI and audioProcessing.py)
 frequencytoMIDI = col.OrderedDict([
 #     |       B       |      A#      |     A     |       G#     |       G       |       F#      |        F      |        E      |        D#     |       D       |      C#       |       C       |
                                                                   (12543.85,127), (11839.82,126), (11175.3,125) , (10548.08,124), (9956.06,123) , (9397.27,122) , (8869.84,121) , (8372.02,120) ,
@@ -48,4 +75,14 @@ frequencytoMIDI = col.OrderedDict([
         (61.74,35)    , (58.27,34)   , (55,33)   , (51.91,32)   , (49,31)       , (46.25,30)    , (43.65,29)    , (41.2,28)     , (38.89,27)    , (36.71,26)    , (34.65,25)    , (32.7,24)     ,
         (30.87,23)    , (29.14,22)   , (27.5,21) , (25.96,20)   , (24.5,19)     , (23.12,18)    , (21.83,17)    , (20.6,16)     , (19.45,15)    , (18.35,14)    , (17.32,13)    , (16.35,12)    ,
         (15.43,11)    , (14.57,10)   , (13.75,9) , (12.98,8)    , (12.25,7)     , (11.56,6)     , (10.91,5)     , (10.3,4)      , (9.72,3)      , (9.18,2)      , (8.66,1)      , (8.18,0)
-])
\ No newline at end of file
+])
+
+# Array version of frequencytoMIDI, lowest note first, for converting many frequencies at once
+# A frequency belongs to the note whose band it falls in; Bands meet halfway between neighbouring notes (on a log scale)
+midiFrequencies = np.array(sorted(frequencytoMIDI))
+midiNumbers = np.array([frequencytoMIDI[frequency] for frequency in midiFrequencies], dtype = np.int16)
+midiBoundaries = np.sqrt(midiFrequencies[1:] * midiFrequencies[:-1])
+
+# Converts an array of frequencies (Hz) to MIDI note numbers with a binary search over the bands; Out of range frequencies go to note 0/127
+def frequenciesToMIDI(frequencies):
+    return midiNumbers[np.searchsorted(midiBoundaries, frequencies)]
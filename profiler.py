@@ -0,0 +1,112 @@
+import contextlib
+import json
+import logging
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# This class times each stage of the pipeline in main.main
+# Stages are either a block of code (stage) or a generator in the streaming pipeline (iterate)
+# As the streaming stages pull from each other, time is kept per stage exclusively: While a stage waits on the stage before it, the clock runs for that one instead
+# For every stage it keeps:
+# seconds:    Wall time spent in the stage itself
+# allocated:  Bytes of memory allocated (net) while in the stage, as measured by tracemalloc
+# items:      Items passed on by a streaming stage
+# When disabled, stage/iterate do nothing and return the generators untouched, so there is no cost to leaving the calls in
+class Profiler:
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self.stages = {}
+        self.counts = {}
+        self.stack = []
+        self.start = None
+        self.peak = 0
+
+    def begin(self):
+        if self.enabled:
+            tracemalloc.start()
+            self.start = time.perf_counter()
+
+    def end(self):
+        if self.enabled:
+            self.total = time.perf_counter() - self.start
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def record(self, name):
+        return self.stages.setdefault(name, {"seconds": 0.0, "allocated": 0, "items": 0})
+
+    # Starts the clock for a stage, pausing the stage that was running
+    def enter(self, name):
+        now = time.perf_counter()
+        memory = tracemalloc.get_traced_memory()[0]
+        if self.stack:
+            self.pause(self.stack[-1], now, memory)
+        self.stack.append([name, now, memory])
+
+    # Stops the clock for the current stage and resumes the one before it
+    def exit(self):
+        now = time.perf_counter()
+        memory = tracemalloc.get_traced_memory()[0]
+        self.pause(self.stack.pop(), now, memory)
+        if self.stack:
+            self.stack[-1][1] = now
+            self.stack[-1][2] = memory
+
+    def pause(self, frame, now, memory):
+        stage = self.record(frame[0])
+        stage["seconds"] += now - frame[1]
+        stage["allocated"] += max(memory - frame[2], 0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def iterate(self, name, iterable):
+        if not self.enabled:
+            return iterable
+        return self.timedIterator(name, iter(iterable))
+
+    def timedIterator(self, name, iterator):
+        stage = self.record(name)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            stage["items"] += 1
+            yield item
+
+    # Adds counters to the report (e.g. midiProcessing.stats)
+    def count(self, counts):
+        if self.enabled:
+            self.counts.update(counts)
+
+    def report(self):
+        return {"total_seconds": self.total, "peak_bytes": self.peak, "stages": self.stages, "counts": self.counts}
+
+    def text(self):
+        lines = ["| Stage          |  Seconds |      Share | Allocated (KiB) |    Items |"]
+        for name, stage in self.stages.items():
+            share = 100 * stage["seconds"] / self.total if self.total else 0
+            lines.append(f"| {name:14} | {stage['seconds']:8.3f} | {share:9.1f}% | {stage['allocated'] / 1024:15.1f} | {stage['items']:8} |")
+        lines.append(f"Total: {self.total:.3f}s, peak memory {self.peak / 1024:.1f} KiB")
+        for name, value in self.counts.items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    def save(self, oFileName):
+        with open (oFileName, "w") as oFile:
+            json.dump(self.report(), oFile, indent = 2)
+        logger.info (f"Profile written to: {oFileName}")
@@ -0,0 +1,170 @@
+import collections as col
+import logging
+import numpy as np
+import midiProcessing as mp
+
+logger = logging.getLogger(__name__)
+
+# Grids are stored as (divisions, swing): The grid has "divisions" steps per ticks_per_beat, the same unit as the _8th grid in midiProcessing
+# swing is where the second step of every pair of steps falls, as a fraction of the pair; 0.5 is straight, 2/3 is a triplet swing feel
+# Grids can be added by picking the divisions/swing that match the feel of the song
+Grids = {
+        "8th"     : (8, 0.5),
+        "16th"    : (16, 0.5),
+        "triplet" : (12, 0.5),
+        "swing"   : (8, 2/3),
+        "swing16" : (16, 2/3)
+}
+
+# This class holds a quantized song as parallel NumPy arrays, one entry per note, sorted by grid slot
+# step/swing describe the grid the song was snapped to (see Grids), with step in ticks
+# slots:      Index of the grid step the note was snapped to; This is the tab column the note ends up in
+# ticks:      Absolute tick of that grid step; Used for the quantized MIDI file
+# pitches:    MIDI note number
+# velocities: MIDI velocity
+# durations:  How long the note was held in the input, in ticks
+class QuantizedSong:
+    def __init__(self, tpb, tempoMap, step, swing, slots, ticks, pitches, velocities, durations):
+        self.tpb = tpb
+        self.tempoMap = tempoMap
+        self.step = step
+        self.swing = swing
+        self.slots = slots
+        self.ticks = ticks
+        self.pitches = pitches
+        self.velocities = velocities
+        self.durations = durations
+
+    def __len__(self):
+        return len(self.pitches)
+
+    # Splits the arrays into one chunk per chord (notes sharing a slot); Returns the start index of every chord
+    def chordStarts(self):
+        return np.concatenate(([0], np.flatnonzero(np.diff(self.slots)) + 1)) if len(self.slots) else np.zeros(0, dtype = np.int64)
+
+    # Yields (key, notes to play) for every chord, where key is taken from the given array (ticks or slots)
+    def groupBy(self, keys):
+        starts = self.chordStarts()
+        ends = np.append(starts[1:], len(self.pitches))
+        for key, start, end in zip(keys[starts].tolist(), starts.tolist(), ends.tolist()):
+            yield key, self.pitches[start:end].tolist()
+
+    # (absolute tick, notes) events, the same shape as midiProcessing.quantizeEvents; Used for the quantized MIDI file
+    def events(self):
+        return self.groupBy(self.ticks)
+
+    # (grid slot, notes) events; Used for tabulature, with a step of 1 between columns
+    def slotEvents(self):
+        return self.groupBy(self.slots)
+
+    # The noteTime table (see midiProcessing.quantizeMIDI), keyed by absolute tick
+    def noteTime(self):
+        return col.OrderedDict(self.events())
+
+    # Writes the song as a quantized MIDI file, keeping the velocity and duration of every note (see midiProcessing.buildMIDI)
+    def writeMIDI(self, oFileName):
+        mp.buildMIDI(self.ticks, self.pitches, self.velocities, self.durations, self.tpb, self.tempoMap, oFileName)
+
+# This function builds a QuantizedSong from (absolute tick, notes) events on a grid of step ticks, such as audioProcessing.audioEvents
+# The events carry no velocity or duration, so every note is played at full velocity and held for one step
+def songFromEvents (events, tpb, tempoMap, step):
+    ticks = []
+    pitches = []
+    for key, value in events:
+        ticks.extend([key] * len(value))
+        pitches.extend(value)
+    ticks = np.array(ticks, dtype = np.int64)
+    count = len(ticks)
+    return QuantizedSong(tpb, tempoMap, step, 0.5, ticks // step, ticks, np.array(pitches, dtype = np.int16),
+                         np.full(count, 127, dtype = np.int16), np.full(count, step, dtype = np.int64))
+
+# This function reads every note_on from an opened MIDI file into NumPy arrays (absolute tick, pitch, velocity, duration), in time order across all tracks
+# A note lasts until the first note_off (or note_on with a velocity of 0) of the same pitch on the same channel; Held notes are released in the order they were played
+# Notes that are never released last until the end of the song
+def extractNotes (inMIDI):
+    ticks = []
+    pitches = []
+    velocities = []
+    ends = []
+    held = col.defaultdict(col.deque)
+    lastTick = 0
+    for absTicks, _, message in mp.mergeTracks(inMIDI):
+        lastTick = absTicks
+        if message.type == "note_on" and message.velocity > 0:
+            held[(message.channel, message.note)].append(len(ticks))
+            ticks.append(absTicks)
+            pitches.append(message.note)
+            velocities.append(message.velocity)
+            ends.append(-1)
+        elif message.type in ("note_on", "note_off") and held[(message.channel, message.note)]:
+            ends[held[(message.channel, message.note)].popleft()] = absTicks
+    ticks = np.array(ticks, dtype = np.int64)
+    ends = np.array(ends, dtype = np.int64)
+    ends[ends < 0] = lastTick
+    return ticks, np.array(pitches, dtype = np.int16), np.array(velocities, dtype = np.int16), ends - ticks
+
+# This function snaps absolute ticks to the nearest point on a grid in one vectorized pass
+# Returns (slot index, snapped absolute tick) for every tick
+def snapToGrid (ticks, tpb, divisions, swing = 0.5):
+    step = tpb / divisions
+    pair = 2 * step
+    # Each pair of steps has three points the note can go to: The start of the pair, the (swung) second step, and the start of the next pair
+    pairIndex = np.floor(ticks / pair)
+    offset = ticks - pairIndex * pair
+    points = np.array([0.0, swing * pair, pair])
+    nearest = np.argmin(np.abs(offset[:, None] - points[None, :]), axis = 1)
+    slots = (2 * pairIndex + nearest).astype(np.int64)
+    snapped = np.floor(pairIndex * pair + points[nearest] + 0.5).astype(np.int64)
+    return slots, snapped
+
+# This function is the vectorized quantizer; It extracts every note of an opened MIDI file into arrays and snaps them to the chosen grid (see Grids)
+# Unlike midiProcessing.quantizeEvents, notes go to the nearest grid point rather than the one before it
+# Filters (all off by default):
+# minVelocity:   Notes quieter than this are dropped
+# relVelocity:   Notes quieter than this fraction of the loudest note in the same chord are dropped
+# ghostTicks:    Notes re-triggering the same pitch within this many ticks are dropped, as they were likely false triggers
+# Raises MIDIError if there is nothing left to transcribe
+def quantizeArrays (inMIDI, grid = "8th", minVelocity = 0, relVelocity = 0.0, ghostTicks = 0):
+    if grid not in Grids:
+        raise ValueError (f"Unknown quantization grid: {grid}; Available grids: {', '.join(Grids)}")
+    divisions, swing = Grids[grid]
+    tpb, tempoMap = mp.readTiming(inMIDI)
+    ticks, pitches, velocities, durations = extractNotes(inMIDI)
+    logger.info (f"Quantizing {len(ticks)} notes to the {grid} grid")
+
+    keep = velocities >= minVelocity
+    if ghostTicks > 0 and len(ticks):
+        # Sorting by pitch (stable, so time order is kept) puts repeated triggers of the same note next to each other
+        order = np.argsort(pitches, kind = "stable")
+        samePitch = pitches[order][1:] == pitches[order][:-1]
+        tooClose = (ticks[order][1:] - ticks[order][:-1]) < ghostTicks
+        ghosts = np.zeros(len(ticks), dtype = bool)
+        ghosts[order[1:][samePitch & tooClose]] = True
+        keep &= ~ghosts
+    ticks, pitches, velocities, durations = ticks[keep], pitches[keep], velocities[keep], durations[keep]
+
+    slots, snapped = snapToGrid(ticks, tpb, divisions, swing)
+    order = np.argsort(slots, kind = "stable")
+    slots, snapped, pitches, velocities, durations = slots[order], snapped[order], pitches[order], velocities[order], durations[order]
+
+    if relVelocity > 0 and len(slots):
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(slots)) + 1))
+        loudest = np.repeat(np.maximum.reduceat(velocities, starts), np.diff(np.append(starts, len(slots))))
+        keep = velocities >= relVelocity * loudest
+        slots, snapped, pitches, velocities, durations = slots[keep], snapped[keep], pitches[keep], velocities[keep], durations[keep]
+
+    if not len(slots):
+        logger.error ("No notes left to transcribe after quantization")
+        raise mp.MIDIError ("No notes left to transcribe after quantization")
+    logger.info (f"MIDI file successfully quantized: {len(slots)} notes kept")
+    return QuantizedSong(tpb, tempoMap, tpb / divisions, swing, slots, snapped, pitches, velocities, durations)
+
+# This function is the array version of midiProcessing.quantizeEvents: Every note goes to the eighth grid point at or before it
+# The step is worked out from the song's own ticks per beat, so it does not depend on the grid set up by midiProcessing.readTiming
+# Used for the quantized MIDI file of the default (no -q) pipeline; The notes and chords are the same as the ones quantizeEvents yields
+def quantizeLegacy (inMIDI):
+    tpb, tempoMap = mp.readTiming(inMIDI)
+    step = max(int(tpb/8), 1)
+    ticks, pitches, velocities, durations = extractNotes(inMIDI)
+    slots = ticks // step
+    return QuantizedSong(tpb, tempoMap, step, 0.5, slots, slots * step, pitches, velocities, durations)
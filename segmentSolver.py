@@ -0,0 +1,121 @@
+import concurrent.futures as cf
+import logging
+import math
+import os
+import midiProcessing as mp
+import tabProcessing as tp
+
+logger = logging.getLogger(__name__)
+
+# Defaults for splitting a song into segments
+# minRest:        Columns of silence that end a segment
+# maxChords:      Segments are cut after this many chords even without a rest, so songs with no rests still split up
+# chunkChords:    Smallest task (in chords) worth sending to a worker; Segments are grouped into tasks of at least this many chords
+# tasksPerWorker: Tasks the song is split into per worker, so the workers stay busy when some tasks take longer than others
+minRest        = 2
+maxChords      = 512
+chunkChords    = 64
+tasksPerWorker = 4
+
+# Note table/settings for the current worker process; Set up once by initWorker
+workerState = {}
+
+# This function cuts the (absolute tick, notes) timeline into segments at rests of at least minRest columns, or every maxChords chords
+# Returns a list of segments, each a list of (absolute tick, notes) in order
+def segmentTimeline(events, step, minRest = minRest, maxChords = maxChords):
+    segments = []
+    segment = []
+    prevColumn = None
+    for tick, notesToPlay in events:
+        column = tick // step
+        if segment and (column - prevColumn > minRest or len(segment) >= maxChords):
+            segments.append(segment)
+            segment = []
+        segment.append((tick, notesToPlay))
+        prevColumn = column
+    if segment:
+        segments.append(segment)
+    return segments
+
+# Groups segments into about tasksPerWorker tasks per worker, keeping them in order; No task is cut smaller than chunkChords chords
+def groupSegments(segments, workers = 1, chunkChords = chunkChords):
+    total = sum(len(segment) for segment in segments)
+    taskChords = max(chunkChords, math.ceil(total / (tasksPerWorker * workers)))
+    tasks = []
+    task = []
+    for segment in segments:
+        task.extend(segment)
+        if len(task) >= taskChords:
+            tasks.append(task)
+            task = []
+    if task:
+        tasks.append(task)
+    return tasks
+
+# Runs once in each worker process; Keeps the note table and a voicing cache for every task the worker handles
+def initWorker(noteTable, maxFWidth, candidates, step, cacheSettings):
+    import voicingCache as vc
+    workerState["noteTable"] = noteTable
+    workerState["maxFWidth"] = maxFWidth
+    workerState["candidates"] = candidates
+    workerState["step"] = step
+    workerState["cache"] = vc.VoicingCache(**cacheSettings) if cacheSettings is not None else None
+
+# Solves the chords of a task or segment in a single process
+# Chord by chord (candidates == 0): Returns a list of (column, chord) for every playable chord
+# Whole-song optimizer: Returns the chordSteps of the events, as the dynamic program itself has to see the whole song
+def solveEvents(events, noteTable, maxFWidth, candidates, step, cache = None):
+    if candidates > 0:
+        return mp.chordSteps(events, noteTable, maxFWidth, candidates, cache, step)
+    result = []
+    for tick, notesToPlay in events:
+        chord = mp.solveNotes(notesToPlay, noteTable, maxFWidth, cache, tick)
+        if chord is not None:
+            result.append((tick // step, chord))
+    return result
+
+# Solves one task inside a worker (see solveEvents); Also returns the worker's midiProcessing.stats for the task, with the hits/misses of its voicing cache
+def solveTask(events):
+    mp.stats.clear()
+    cache = workerState["cache"]
+    if cache is not None:
+        hits, misses = cache.hits, cache.misses
+    result = solveEvents(events, workerState["noteTable"], workerState["maxFWidth"], workerState["candidates"], workerState["step"], cache)
+    taskStats = dict(mp.stats)
+    if cache is not None:
+        cache.flush()
+        taskStats["cache hits"] = cache.hits - hits
+        taskStats["cache misses"] = cache.misses - misses
+    return result, taskStats
+
+# This function solves a list of tasks (each a list of (absolute tick, notes)) over a pool of worker processes (see solveTask)
+# Many small tasks (e.g. the windows of incremental.py) are sent to the workers in batches, about tasksPerWorker per worker
+# Returns (result, stats) for every task, in order
+def solveParallel(tasks, noteTable, maxFWidth, step, workers = None, candidates = 0, cacheSettings = None):
+    chunksize = max(1, len(tasks) // (tasksPerWorker * (workers or os.cpu_count() or 1)))
+    with cf.ProcessPoolExecutor(max_workers = workers, initializer = initWorker,
+                                initargs = (noteTable, maxFWidth, candidates, step, cacheSettings)) as pool:
+        return list(pool.map(solveTask, tasks, chunksize = chunksize))
+
+# This function creates tabulature like notesToTabs (or notesToTabsGlobal when candidates > 0), with the chords solved over a pool of worker processes
+# The song is cut into segments at rests (see segmentTimeline), the segments are solved in parallel and stitched back together in order
+# Every chord is solved on its own, and the whole-song optimizer only runs its dynamic program once all candidates are back, so the tabs are the same as a serial run
+# cacheSettings are the keyword arguments for a voicingCache.VoicingCache in each worker, or None for no cache
+# The stats of every task (cache hits/misses of the workers included) are added to midiProcessing.stats
+# Returns a tabProcessing.TabMatrix
+def notesToTabsParallel(noteTime, noteTable, maxFWidth, step, workers = None, candidates = 0, cacheSettings = None):
+    lastNT = list(noteTime.keys())[-1]
+    length = lastNT//step + 1
+    segments = segmentTimeline(noteTime.items(), step)
+    tasks = groupSegments(segments, workers or os.cpu_count() or 1)
+    logger.info (f"Solving {len(noteTime)} chords in {len(segments)} segments ({len(tasks)} tasks) over {workers or 'all'} workers")
+
+    results = solveParallel(tasks, noteTable, maxFWidth, step, workers, candidates, cacheSettings)
+
+    stitched = []
+    for result, taskStats in results:
+        stitched.extend(result)
+        mp.stats.update(taskStats)
+    if candidates > 0:
+        return mp.viterbiTabs(stitched, length)
+    return tp.TabMatrix.fromChords(stitched, length)
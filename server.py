@@ -0,0 +1,257 @@
+import collections as col
+import concurrent.futures as cf
+import http.server
+import io
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+import midiProcessing as mp
+import tabProcessing as tp
+import notes
+import quantizer as qz
+import voicingCache as vc
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the transcription server
+# port:              Port the server listens on (localhost only)
+# maxBody:           Largest MIDI file accepted, in bytes
+# pendingPerWorker:  Requests allowed to wait per worker process before new ones are turned away (503)
+port             = 8765
+maxBody          = 16 << 20
+pendingPerWorker = 4
+
+# Content type of the response for every output format (see tabProcessing.Renderers)
+ContentTypes = {
+        "ascii"    : "text/plain; charset=utf-8",
+        "json"     : "application/x-ndjson",
+        "musicxml" : "application/vnd.recordare.musicxml+xml"
+}
+
+# Warm state for the current worker process; Note tables and voicing caches are built on first use and kept for every later request
+workerCachePath = None
+workerTables = {}
+workerCaches = {}
+
+# Runs once in each worker process; Builds the default note table up front so the first request does not pay for it
+def initWorker(cachePath):
+    global workerCachePath
+    workerCachePath = cachePath
+    noteTableFor("standard", 0, 15)
+
+def noteTableFor(tuning, capo, maxFret):
+    key = (tuning, capo, maxFret)
+    if key not in workerTables:
+        workerTables[key] = notes.FretTable(iTuning = tuning, capo = capo, maxFret = maxFret)
+    return workerTables[key]
+
+def cacheFor(tuning, capo, maxFret, maxFWidth):
+    key = (tuning, capo, maxFret, maxFWidth)
+    if key not in workerCaches:
+        workerCaches[key] = vc.VoicingCache(tuning, capo, maxFret, maxFWidth, path = workerCachePath)
+    return workerCaches[key]
+
+def warm(index):
+    return os.getpid()
+
+# Transcribes one request inside a worker; The MIDI file and the tabs only ever live in memory, nothing is written under ./output
+# Returns (tabs as text, seconds spent in the worker, midiProcessing.stats for the request)
+def transcribeRequest(data, settings):
+    start = time.perf_counter()
+    mp.stats.clear()
+    inMIDI = mp.openMIDIBytes(data)
+    step = None
+    if settings["grid"] is None:
+        mp.readTiming(inMIDI)
+        events = mp.requireNotes(mp.quantizeEvents(inMIDI), "request")
+    else:
+        song = qz.quantizeArrays(inMIDI, settings["grid"], settings["minVelocity"], settings["relVelocity"], settings["ghostTicks"])
+        events = song.slotEvents()
+        step = 1
+    tuning, capo, maxFret, maxFWidth = settings["tuning"], settings["capo"], settings["maxFret"], settings["maxFWidth"]
+    noteTable = noteTableFor(tuning, capo, maxFret)
+    cache = cacheFor(tuning, capo, maxFret, maxFWidth)
+    if settings["candidates"] > 0:
+        tabs = mp.notesToTabsGlobal(col.OrderedDict(events), None, None, noteTable, maxFWidth, settings["candidates"], cache, step)
+    else:
+        tabs = mp.streamTabs(events, noteTable, maxFWidth, cache, step)
+    buffer = io.StringIO()
+    # A bar is one beat, as on the command line: 8 columns, or the steps per beat of the grid
+    columnsPerBar = qz.Grids[settings["grid"]][0] if settings["grid"] is not None else 8
+    tp.writeTabs(tabs, buffer, settings["format"], columnsPerBar, tuning = notes.Tunings[tuning], capo = capo)
+    cache.flush()
+    return buffer.getvalue(), time.perf_counter() - start, dict(mp.stats)
+
+# This function reads the settings of a request from its query string; Names and defaults follow the command line (see main.py)
+# Raises ValueError for anything that can not be transcribed
+def parseSettings(query):
+    params = {name: values[-1] for name, values in urllib.parse.parse_qs(query).items()}
+    settings = {
+        "tuning"      : params.get("tuning", "standard"),
+        "capo"        : int(params.get("capo", 0)),
+        "maxFret"     : int(params.get("fret", 15)),
+        "maxFWidth"   : int(params.get("width", 5)),
+        "candidates"  : int(params.get("candidates", 0)),
+        "grid"        : params.get("grid"),
+        "minVelocity" : int(params.get("velocity", 0)),
+        "relVelocity" : int(params.get("relvelocity", 0)) / 100,
+        "ghostTicks"  : int(params.get("ghost", 0)),
+        "format"      : params.get("format", "ascii").lower()
+    }
+    if settings["tuning"] not in notes.Tunings:
+        raise ValueError (f"Unknown tuning: {settings['tuning']}; Available tunings: {', '.join(notes.Tunings)}")
+    if settings["grid"] is not None and settings["grid"] not in qz.Grids:
+        raise ValueError (f"Unknown quantization grid: {settings['grid']}; Available grids: {', '.join(qz.Grids)}")
+    if settings["format"] not in tp.Renderers:
+        raise ValueError (f"Unknown output format: {settings['format']}; Available formats: {', '.join(tp.Renderers)}")
+    return settings
+
+# This class keeps the request metrics of the server; Shared by every request thread
+# Latencies are kept for the last "window" requests, and reported as percentiles in milliseconds
+# latency:    Time from the request being read to the tabs being ready, including waiting for a worker
+# worker:     Time spent transcribing inside the worker
+class Metrics:
+    def __init__(self, window = 10000):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts = col.Counter()
+        self.inFlight = 0
+        self.latencies = col.deque(maxlen = window)
+        self.workerTimes = col.deque(maxlen = window)
+
+    def begin(self):
+        with self.lock:
+            self.inFlight += 1
+
+    def end(self, result, latency = None, workerTime = None):
+        with self.lock:
+            self.inFlight -= 1
+            self.counts[result] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+                self.workerTimes.append(workerTime)
+
+    def count(self, result):
+        with self.lock:
+            self.counts[result] += 1
+
+    @staticmethod
+    def percentiles(values):
+        if not values:
+            return {}
+        ordered = sorted(values)
+        pick = lambda p: 1000 * ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+        return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": 1000 * ordered[-1], "mean": 1000 * sum(ordered) / len(ordered)}
+
+    def report(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            workerTimes = list(self.workerTimes)
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "in_flight": self.inFlight,
+                "requests": dict(self.counts),
+                "latency_ms": self.percentiles(latencies),
+                "worker_ms": self.percentiles(workerTimes)
+            }
+
+# Handles a single HTTP request; Every request runs on its own thread, and the transcription itself is handed to the worker pool
+# POST /tabs      Body is a MIDI file; Settings go in the query string (e.g. /tabs?tuning=dropd&capo=2&format=json); Returns the tabs
+# GET  /metrics   Request counts and latency percentiles as JSON
+# GET  /health    Returns OK once the server is up
+class TabRequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "MIDI2Tab"
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        if path == "/metrics":
+            self.reply(200, json.dumps(self.server.metrics.report(), indent = 2), "application/json")
+        elif path == "/health":
+            self.reply(200, "OK\n")
+        else:
+            self.reply(404, f"Unknown path: {path}\n")
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/tabs":
+            self.reply(404, f"Unknown path: {url.path}\n")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0 or length > maxBody:
+            self.server.metrics.count("bad request")
+            self.reply(413 if length > 0 else 400, f"Expected a MIDI file of up to {maxBody} bytes as the request body\n")
+            return
+        data = self.rfile.read(length)
+        try:
+            settings = parseSettings(url.query)
+        except ValueError as e:
+            self.server.metrics.count("bad request")
+            self.reply(400, f"Error - {e}\n")
+            return
+        if not self.server.slots.acquire(blocking = False):
+            self.server.metrics.count("rejected")
+            self.reply(503, "Error - Too many requests waiting; Try again later\n")
+            return
+
+        start = time.perf_counter()
+        self.server.metrics.begin()
+        try:
+            text, workerTime, _ = self.server.pool.submit(transcribeRequest, data, settings).result()
+        except mp.MIDIError as e:
+            self.server.metrics.end("failed")
+            self.reply(422, f"Error - {e}\n")
+            return
+        except Exception as e:
+            logger.error (f"Transcription failed: {type(e).__name__}: {e}")
+            self.server.metrics.end("error")
+            self.reply(500, f"Error - {type(e).__name__}: {e}\n")
+            return
+        finally:
+            self.server.slots.release()
+        latency = time.perf_counter() - start
+        self.server.metrics.end("ok", latency, workerTime)
+        logger.info (f"Transcribed {length} bytes in {1000 * latency:.1f} ms ({1000 * workerTime:.1f} ms in worker)")
+        self.reply(200, text, ContentTypes[settings["format"]])
+
+    def reply(self, status, text, contentType = "text/plain; charset=utf-8"):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug (f"{self.address_string()} - {format % args}")
+
+# The HTTP server itself; Holds the worker pool, the bound on waiting requests and the metrics shared by every request thread
+class TabServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool, maxPending):
+        super().__init__(address, TabRequestHandler)
+        self.pool = pool
+        self.slots = threading.BoundedSemaphore(maxPending)
+        self.metrics = Metrics()
+
+# This function runs the transcription server on localhost until interrupted
+# workers worker processes (default one per CPU) keep their note tables/voicing caches warm across requests; cachePath adds the on-disk voicing cache shared with the CLI
+# Up to pendingPerWorker requests per worker are queued; Any more are turned away with 503 rather than piling up
+def runServer(port = port, workers = None, cachePath = None, host = "127.0.0.1"):
+    workers = workers or os.cpu_count() or 1
+    with cf.ProcessPoolExecutor(max_workers = workers, initializer = initWorker, initargs = (cachePath,)) as pool:
+        # Start every worker up front, so no request pays for the imports/note table
+        list(pool.map(warm, range(workers)))
+        server = TabServer((host, port), pool, workers * pendingPerWorker)
+        print (f"Serving tabs on http://{host}:{port}/tabs with {workers} workers; Press Ctrl+C to stop")
+        logger.info (f"Transcription server listening on {host}:{port} with {workers} workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    logger.info (f"Transcription server stopped: {server.metrics.report()['requests']}")
@@ -1,51 +1,260 @@
 import logging
+import array
+import json
+import math
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
-# These functions pretty print tabulature from the inputs;
-def tabPrettyPrint (neck, oFile):
-    logging.info ("Pretty Printing tabulature")
-    oString = [ "" for _ in range(6) ]
-    bars = 0
+# A column where no strings are played; Shared, so rests do not need a list each
+REST = (-1, -1, -1, -1, -1, -1)
+
+# This class stores tabulature as a run-length style sparse matrix: Only columns where something is played are kept
+# columns:    int64 array of the column index of every chord, in increasing order
+# frets:      (chords x 6) int8 matrix of the frets for every chord (-1 meaning the string is not played)
+# length:     Total number of columns, rests included
+# Iterating over it gives every column from the start, with rests as REST, so it can be used wherever a list of tabs was used before
+class TabMatrix:
+    def __init__(self, length, columns, frets):
+        self.length = length
+        self.columns = columns
+        self.frets = frets
+
+    # Builds a TabMatrix from (column index, chord) pairs in increasing column order
+    @classmethod
+    def fromChords(cls, chords, length):
+        columns = array.array("q")
+        frets = array.array("b")
+        for column, chord in chords:
+            columns.append(column)
+            frets.extend(chord)
+        return cls(length, np.frombuffer(columns, dtype = np.int64), np.frombuffer(frets, dtype = np.int8).reshape(-1, 6))
+
+    # Builds a TabMatrix from every column of a song in order (e.g. from midiProcessing.streamTabs), dropping the rests
+    @classmethod
+    def fromColumns(cls, tabs):
+        length = 0
+        def chords():
+            nonlocal length
+            for column, chord in enumerate(tabs):
+                length = column + 1
+                if max(chord) >= 0:
+                    yield column, chord
+        matrix = cls.fromChords(chords(), 0)
+        matrix.length = length
+        return matrix
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        nextColumn = 0
+        for column, chord in zip(self.columns.tolist(), self.frets.tolist()):
+            while nextColumn < column:
+                yield REST
+                nextColumn += 1
+            yield chord
+            nextColumn = column + 1
+        while nextColumn < self.length:
+            yield REST
+            nextColumn += 1
+
+    # The full (columns x 6) int8 matrix, rests included
+    def dense(self):
+        matrix = np.full((self.length, 6), -1, dtype = np.int8)
+        matrix[self.columns] = self.frets
+        return matrix
+
+# How a single fret is drawn in ASCII tabulature; Every cell is 2 characters wide
+def fretCell (fret):
+    if fret < 0:
+        return "--"
+    elif fret < 10:
+        return f"-{fret}"
+    return f"{fret}"
+
+# Size of the write buffer used by the renderers
+bufferSize = 1 << 16
+
+# Renderers take tab columns one at a time and write them out a system (line of bars) at a time, so memory does not grow with the length of the song
+# Every renderer is used as: begin(), column() for every column in order, then end()
+# columnsPerBar/barsPerLine set the layout; tuning is the list of open string MIDI notes (see notes.Tunings) and capo the capo position, for formats that need pitches
+class TabRenderer:
+    extension = ".txt"
+
+    def __init__(self, oFile, columnsPerBar = 8, barsPerLine = 4, tuning = None, capo = 0):
+        self.oFile = oFile
+        self.columnsPerBar = columnsPerBar
+        self.barsPerLine = barsPerLine
+        self.tuning = tuning if tuning is not None else [40, 45, 50, 55, 59, 64]
+        self.capo = capo
+
+    def begin(self):
+        pass
+
+    def column(self, chord):
+        raise NotImplementedError
+
+    def end(self):
+        pass
+
+# The original ASCII layout: Highest string on top, a "|" after every bar and a blank line after every system
+class AsciiRenderer(TabRenderer):
+    extension = ".txt"
+    cells = [fretCell(fret) for fret in range(-1, 100)]
+
+    def begin(self):
+        self.lines = [[] for _ in range(6)]
+        self.index = 0
+        self.bars = 0
+
+    def column(self, chord):
+        for string, fret in enumerate(chord):
+            self.lines[string].append(self.cells[fret + 1])
+        # Draw a set of newlines
+        if (self.index % self.columnsPerBar) == self.columnsPerBar - 1:
+            if self.bars <= self.barsPerLine - 2:
+                self.bars += 1
+                for line in self.lines:
+                    line.append("|")
+            else:
+                self.writeSystem()
+                self.bars = 0
+        self.index += 1
+
+    def writeSystem(self):
+        self.oFile.write("".join("".join(line) + "|\n" for line in reversed(self.lines)) + "\n")
+        self.lines = [[] for _ in range(6)]
 
-    # 
+    def end(self):
+        self.writeSystem()
+
+# Line-delimited JSON, one bar per line: {"bar": <bar index>, "column": <first column index>, "frets": [[6 frets, lowest string first], ...]}
+class JsonRenderer(TabRenderer):
+    extension = ".jsonl"
+
+    def begin(self):
+        self.bar = []
+        self.barIndex = 0
+
+    def column(self, chord):
+        self.bar.append(list(chord))
+        if len(self.bar) == self.columnsPerBar:
+            self.writeBar()
+
+    def writeBar(self):
+        self.oFile.write(json.dumps({"bar": self.barIndex, "column": self.barIndex * self.columnsPerBar, "frets": self.bar}) + "\n")
+        self.bar = []
+        self.barIndex += 1
+
+    def end(self):
+        if self.bar:
+            self.writeBar()
+
+# MusicXML tablature (a single TAB staff); MusicXML numbers strings from the highest (1) down
+# A tab bar is one beat of columnsPerBar equal notes, and every measure is 4/4; 32nds for the default 8 columns per bar, 64ths for 16, 32nd triplets for 12, and so on
+class MusicXMLRenderer(TabRenderer):
+    extension = ".musicxml"
+    steps = [("C", 0), ("C", 1), ("D", 0), ("D", 1), ("E", 0), ("F", 0), ("F", 1), ("G", 0), ("G", 1), ("A", 0), ("A", 1), ("B", 0)]
+    noteTypes = {1: "whole", 2: "half", 4: "quarter", 8: "eighth", 16: "16th", 32: "32nd", 64: "64th", 128: "128th"}
+
+    def begin(self):
+        self.oFile.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                         '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" "http://www.musicxml.org/dtds/partwise.dtd">\n'
+                         '<score-partwise version="4.0">\n'
+                         '  <part-list><score-part id="P1"><part-name>Guitar</part-name></score-part></part-list>\n'
+                         '  <part id="P1">\n')
+        self.measure = []
+        self.measureColumns = 0
+        self.measureIndex = 0
+        # A column is 1/columnsPerBar of a beat (a 32nd note on the default grid), and a measure holds 4 beats
+        # Durations count divisions of a quarter note, so every column lasts one division
+        self.divisions = self.columnsPerBar
+        self.measureLength = 4 * self.columnsPerBar
+        # Columns that are not a plain note type are written as tuplets of the next longer one (e.g. 12 columns per beat are 32nds, 3 in the time of 2)
+        normal = 1 << (self.measureLength.bit_length() - 1)
+        self.noteType = f"<duration>1</duration><type>{self.noteTypes[normal]}</type>"
+        if normal != self.measureLength:
+            common = math.gcd(self.measureLength, normal)
+            self.noteType += (f"<time-modification><actual-notes>{self.measureLength // common}</actual-notes>"
+                              f"<normal-notes>{normal // common}</normal-notes></time-modification>")
+
+    def pitch(self, midiNote):
+        step, alter = self.steps[midiNote % 12]
+        alterXML = f"<alter>{alter}</alter>" if alter else ""
+        return f"<pitch><step>{step}</step>{alterXML}<octave>{midiNote // 12 - 1}</octave></pitch>"
+
+    def attributes(self):
+        tuningXML = "".join(
+            f'<staff-tuning line="{i + 1}"><tuning-step>{self.steps[note % 12][0]}</tuning-step>'
+            + (f"<tuning-alter>{self.steps[note % 12][1]}</tuning-alter>" if self.steps[note % 12][1] else "")
+            + f"<tuning-octave>{note // 12 - 1}</tuning-octave></staff-tuning>"
+            for i, note in enumerate(self.tuning))
+        capoXML = f"<capo>{self.capo}</capo>" if self.capo else ""
+        return (f"      <attributes><divisions>{self.divisions}</divisions>"
+                "<time><beats>4</beats><beat-type>4</beat-type></time>"
+                "<clef><sign>TAB</sign><line>5</line></clef>"
+                f"<staff-details><staff-lines>6</staff-lines>{tuningXML}{capoXML}</staff-details></attributes>\n")
+
+    def column(self, chord):
+        notesXML = []
+        for string, fret in enumerate(chord):
+            if fret < 0:
+                continue
+            chordXML = "<chord/>" if notesXML else ""
+            notesXML.append(f"      <note>{chordXML}{self.pitch(self.tuning[string] + self.capo + fret)}{self.noteType}"
+                            f"<notations><technical><string>{6 - string}</string><fret>{fret}</fret></technical></notations></note>\n")
+        if not notesXML:
+            notesXML.append(f"      <note><rest/>{self.noteType}</note>\n")
+        self.measure.extend(notesXML)
+        self.measureColumns += 1
+        if self.measureColumns == self.measureLength:
+            self.writeMeasure()
+
+    def writeMeasure(self):
+        self.measureIndex += 1
+        attributes = self.attributes() if self.measureIndex == 1 else ""
+        self.oFile.write(f'    <measure number="{self.measureIndex}">\n{attributes}' + "".join(self.measure) + "    </measure>\n")
+        self.measure = []
+        self.measureColumns = 0
+
+    def end(self):
+        if self.measure or self.measureIndex == 0:
+            self.writeMeasure()
+        self.oFile.write("  </part>\n</score-partwise>\n")
+
+# Output formats that can be picked with -o; Formats can be added by subclassing TabRenderer
+Renderers = {
+        "ascii"    : AsciiRenderer,
+        "json"     : JsonRenderer,
+        "musicxml" : MusicXMLRenderer
+}
+
+# This function writes tabulature (any iterable of 6 fret columns, e.g. a TabMatrix or midiProcessing.streamTabs) to an open text file or buffer in the chosen format
+def writeTabs (neck, tabFile, format = "ascii", columnsPerBar = 8, barsPerLine = 4, tuning = None, capo = 0):
+    renderer = Renderers[format](tabFile, columnsPerBar, barsPerLine, tuning, capo)
+    renderer.begin()
+    for chord in neck:
+        renderer.column(chord)
+    renderer.end()
+
+# This function writes tabulature to a file in the chosen format (see writeTabs)
+# Errors opening/writing the file are logged and raised as OSError
+def renderTabs (neck, oFile, format = "ascii", columnsPerBar = 8, barsPerLine = 4, tuning = None, capo = 0):
+    logging.info (f"Rendering tabulature as {format}")
     try:
-        with open (oFile, "w+") as tabFile:
-            for index, chord in enumerate(neck):
-                for string, fret in enumerate(chord):
-                    if fret < 0:
-                        oString[string] += "--"
-                    elif fret < 10:
-                        oString[string] += f"-{fret}"
-                    else:
-                        oString[string] += f"{fret}"
-                # Draw a set of newlines
-                if (index % 8) == 7:
-                    if bars <= 2:
-                        bars += 1
-                        for i in range (-1, -len(oString)-1, -1):
-                            oString[i] += "|"
-                    else:
-                        for i in range (-1, -len(oString)-1, -1):
-                            tabFile.write (oString[i] + "|\n")
-                        oString = [ "" for _ in range(6) ]
-                        bars = 0
-                        tabFile.write ("\n")
-            for i in range (-1, -len(oString)-1, -1):
-                tabFile.write (oString[i] + "|\n")
-            tabFile.write ("\n")
-            logging.info (f"Successfully printed guitar tabulature to: {oFile}")
-    except:
-        logging.error (f"Unable to open specified output file {oFile}")
+        with open (oFile, "w", buffering = bufferSize) as tabFile:
+            writeTabs (neck, tabFile, format, columnsPerBar, barsPerLine, tuning, capo)
+    except OSError as e:
+        logging.error (f"Unable to write to the specified output file {oFile}: {e}")
+        raise
+    logging.info (f"Successfully printed guitar tabulature to: {oFile}")
+
+# This function pretty prints tabulature in the original ASCII layout
+def tabPrettyPrint (neck, oFile):
+    logging.info ("Pretty Printing tabulature")
+    renderTabs (neck, oFile, "ascii")
 
 def tabPrettyPrintChord (neck):
-    oString = [ "" for _ in range(6) ]
-    for string, fret in enumerate(neck):
-        if fret < 0:
-            oString[string] += "--"
-        elif fret < 10:
-            oString[string] += f"-{fret}"
-        else:
-            oString[string] += f"{fret}"
-    for i in range (-1, -len(oString)-1, -1):
-        logging.debug(f"{oString[i]}")
\ No newline at end of file
+    for fret in reversed(list(neck)):
+        logging.debug(fretCell(fret))
@@ -0,0 +1,105 @@
+import collections as col
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import notes
+import midiProcessing as mp
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the way voicings are solved changes, so old on-disk entries are thrown away
+CACHE_VERSION = 1
+
+# Default location of the on-disk cache; Shared by every run (and process) started from the same folder
+defaultCachePath = os.path.join(".", "output", "voicings.db")
+
+# This class memoizes chord voicings so that a chord is only solved once per instrument configuration
+# Entries are keyed by the notes of the chord and the instrument configuration (tuning, capo, maxFret, maxFWidth)
+# The notes are kept in the order they are played, as the solver prefers fingerings for earlier notes; Repeated notes are dropped
+# There are two layers:
+# 1. An in-process LRU holding up to maxSize chords
+# 2. An optional sqlite file (e.g. ./output/voicings.db) shared across runs and processes
+# The sqlite file remembers a hash of notes.Tunings, and is emptied whenever the tuning definitions change
+class VoicingCache:
+    def __init__(self, tuning = "standard", capo = 0, maxFret = 15, maxFWidth = 5, path = None, maxSize = 4096):
+        tuningNotes = notes.Tunings.get(tuning, notes.Tunings["standard"])
+        self.config = f"v{CACHE_VERSION}|{','.join(str(n) for n in tuningNotes)}|{capo}|{maxFret}|{maxFWidth}"
+        self.maxFWidth = maxFWidth
+        self.maxSize = maxSize
+        self.lru = col.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        self.pending = []
+        if path is not None:
+            self.openDB(path)
+
+    # Opens (or creates) the on-disk store and clears it if the tuning definitions have changed since it was written
+    def openDB(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        self.db = sqlite3.connect(path, timeout = 30)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS voicings (config TEXT, chord TEXT, voicings TEXT, PRIMARY KEY (config, chord))")
+        tuningsHash = hashlib.sha1(json.dumps(notes.Tunings, sort_keys = True).encode()).hexdigest()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'tunings'").fetchone()
+        if row is None or row[0] != tuningsHash:
+            if row is not None:
+                logger.info (f"Tuning definitions changed; Clearing voicing cache: {path}")
+            self.db.execute("DELETE FROM voicings")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('tunings', ?)", (tuningsHash,))
+        self.db.commit()
+        logger.info (f"Using on-disk voicing cache: {path}")
+
+    # Returns up to k voicings of a chord in noteTable preference order, solving it only on a cache miss
+    def candidates(self, notesToPlay, noteTable, k):
+        key = (tuple(dict.fromkeys(notesToPlay)), k)
+        voicings = self.lru.get(key)
+        if voicings is not None:
+            self.lru.move_to_end(key)
+            self.hits += 1
+            return [list(v) for v in voicings]
+
+        chordKey = f"{k}|{','.join(str(n) for n in key[0])}"
+        if self.db is not None:
+            row = self.db.execute("SELECT voicings FROM voicings WHERE config = ? AND chord = ?", (self.config, chordKey)).fetchone()
+            if row is not None:
+                voicings = tuple(tuple(v) for v in json.loads(row[0]))
+                self.hits += 1
+        if voicings is None:
+            self.misses += 1
+            voicings = tuple(tuple(v) for v in mp.chordCandidates(key[0], noteTable, self.maxFWidth, k))
+            if self.db is not None:
+                self.pending.append((self.config, chordKey, json.dumps(voicings)))
+
+        self.lru[key] = voicings
+        if len(self.lru) > self.maxSize:
+            self.lru.popitem(last = False)
+        return [list(v) for v in voicings]
+
+    # Same as midiProcessing.solveChord, but cached
+    def solve(self, notesToPlay, noteTable):
+        voicings = self.candidates(notesToPlay, noteTable, 1)
+        return voicings[0] if voicings else None
+
+    # Writes newly solved chords to the on-disk store
+    def flush(self):
+        if self.db is not None and self.pending:
+            self.db.executemany("INSERT OR REPLACE INTO voicings VALUES (?, ?, ?)", self.pending)
+            self.db.commit()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        logger.info (f"Voicing cache: {self.stats()}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = (100 * self.hits / total) if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"